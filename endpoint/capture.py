@@ -0,0 +1,117 @@
+import base64
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Union
+
+from fastapi.requests import Request
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler which drops records instead of blocking or raising when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BlockingSentinelQueueListener(QueueListener):
+    """Wait for room in a full queue on stop, instead of failing to enqueue the stop sentinel."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class TrafficCapture:
+    """
+    Sample incoming requests into a rotating NDJSON file, one request per line.
+    File writes and rotation happen in a separate thread, so the event loop never blocks on disk.
+    If the writer falls behind by more than queue_size records, new samples are dropped.
+    Captured files can be replayed with `python -m endpoint.replay`.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        sample_rate: float = 1.0,
+        max_bytes: int = 100_000_000,
+        backup_count: int = 5,
+        queue_size: int = 10_000,
+    ):
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger("endpoint.capture")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.listener = BlockingSentinelQueueListener(self.handler.queue, self.file_handler)
+        self.listener.start()
+        self.logger.addHandler(self.handler)
+        logging.info(f"Capturing {sample_rate:.0%} of requests to {filename}")
+
+    @classmethod
+    def from_envs(cls) -> Union["TrafficCapture", None]:
+        """Create capture if CAPTURE_FILE is set, otherwise return None."""
+        filename = os.getenv("CAPTURE_FILE")
+        if not filename:
+            return None
+        return cls(
+            filename,
+            sample_rate=float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0")),
+            max_bytes=int(os.getenv("CAPTURE_MAX_BYTES", "100000000")),
+            backup_count=int(os.getenv("CAPTURE_BACKUP_COUNT", "5")),
+            queue_size=int(os.getenv("CAPTURE_QUEUE_SIZE", "10000")),
+        )
+
+    def close(self):
+        """Stop capturing and write queued records to file."""
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        self.file_handler.close()
+        if self.handler.dropped:
+            logging.warning(f"Dropped {self.handler.dropped} captured requests, writer was too slow")
+
+    async def sample(self, request: Request, path: str):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        body = await request.body()
+        record = {
+            "ts": time.time(),
+            "method": request.method,
+            "path": path,
+            "headers": dict(request.headers),
+            "query": list(request.query_params.multi_items()),
+        }
+        try:
+            record["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            record["body_b64"] = base64.b64encode(body).decode("ascii")
+        self.logger.info(json.dumps(record))
+
+
+def read_capture(filename: str) -> list:
+    """Read captured requests from an NDJSON file, ordered by timestamp."""
+    records = []
+    with open(filename, "r") as file:
+        for line in file:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def get_record_body(record: dict) -> bytes:
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    return record.get("body", "").encode("utf-8")
@@ -0,0 +1,47 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Union
+
+
+class DeliveryTracker:
+    """
+    Bounded in-memory table of Kafka delivery results for asynchronously acknowledged requests.
+    When the table is full, the oldest entries are dropped.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.deliveries: OrderedDict = OrderedDict()
+
+    def add(self, path: str, topic_name: str) -> str:
+        """Register a new pending delivery and return its request id."""
+        request_id = uuid.uuid4().hex
+        self.deliveries[request_id] = {
+            "request_id": request_id,
+            "path": path,
+            "topic": topic_name,
+            "status": "pending",
+            "created_at": time.time(),
+        }
+        while len(self.deliveries) > self.max_size:
+            self.deliveries.popitem(last=False)
+        return request_id
+
+    def delivered(self, request_id: str, record_metadata):
+        delivery = self.deliveries.get(request_id)
+        if delivery is not None:
+            delivery["status"] = "delivered"
+            delivery["partition"] = record_metadata.partition
+            delivery["offset"] = record_metadata.offset
+            delivery["completed_at"] = time.time()
+
+    def failed(self, request_id: str, error: Union[Exception, str]):
+        delivery = self.deliveries.get(request_id)
+        if delivery is not None:
+            delivery["status"] = "failed"
+            delivery["error"] = str(error)
+            delivery["completed_at"] = time.time()
+
+    def get(self, request_id: str) -> Union[dict, None]:
+        return self.deliveries.get(request_id)
@@ -1,25 +1,44 @@
-import importlib
 import logging
 import os
 import pprint
 import json
+import asyncio
+import secrets
+import time
 from contextlib import asynccontextmanager
 
-import httpx
 from fastapi import FastAPI
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse, PlainTextResponse, Response
-from fvhiot.utils.aiokafka import (get_aiokafka_producer_by_envs,
-                                   on_send_error, on_send_success)
+from fvhiot.utils.aiokafka import on_send_error, on_send_success
 from fvhiot.utils.data import data_pack
-from fvhiot.utils.http.starlettetools import \
-    extract_data_from_starlette_request
 from sentry_asgi import SentryMiddleware
 
-from endpoints import AsyncRequestHandler as RequestHandler
+from endpoints.models import EndpointConfig, RequestView
+from endpoints import validation
+from endpoints.validation import compile_payload_validator, reject_invalid_config
 
-app_producer = None
+from .capture import TrafficCapture
+from .delivery import DeliveryTracker
+from .handlers import HandlerLoader
+from .producer import ProducerManager
+from .registry import DeviceRegistryClient, RegistryUnavailable
+from .stats import StatsRegistry
+
+app_producer_manager = ProducerManager.from_envs()
+app_handler_loader = HandlerLoader(float(os.getenv("HANDLER_DRAIN_TIMEOUT", "30")))
+app_stats = StatsRegistry(
+    window=float(os.getenv("STATS_WINDOW", "60")), top_k=int(os.getenv("STATS_TOP_DEVICES", "20"))
+)
+# Handle one notification at a time, so handler modules are not loaded concurrently
+app_notify_lock = asyncio.Lock()
 app_endpoints = {}
+app_registry_client = None
+app_capture = None
+app_delivery_tracker = DeliveryTracker(int(os.getenv("DELIVERY_TRACKER_SIZE", "100000")))
+# Keep references to background send tasks, so they are not garbage collected before completion
+app_send_tasks = set()
+MAX_PENDING_SENDS = int(os.getenv("MAX_PENDING_SENDS", "1000"))
 
 # TODO: for testing, add better defaults (or remove completely to make sure it is set in env)
 ENDPOINT_CONFIG_URL = os.getenv(
@@ -28,6 +47,8 @@ ENDPOINT_CONFIG_URL = os.getenv(
 DEVICE_REGISTRY_TOKEN = os.getenv(
     "DEVICE_REGISTRY_TOKEN", "abcdef1234567890abcdef1234567890abcdef12"
 )
+# Token for admin routes (/stats), which are disabled when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 device_registry_request_headers = {
     "Authorization": f"Token {DEVICE_REGISTRY_TOKEN}",
@@ -42,16 +63,19 @@ async def lifespan(app: FastAPI):
     # TODO: Test external connections here, e.g. device registry, redis etc. and crash if some mandatory
     # service is missing.
     global app_endpoints
-    global app_producer
+    global app_registry_client
+    global app_capture
+    app_capture = TrafficCapture.from_envs()
+    app_registry_client = DeviceRegistryClient.from_envs(
+        ENDPOINT_CONFIG_URL, device_registry_request_headers
+    )
+    await app_registry_client.start()
     endpoints = await get_endpoints_from_device_registry(True)
     logging.debug("\n" + pprint.pformat(endpoints))
     if endpoints:
         app_endpoints = endpoints
-    try:
-        app_producer = await get_aiokafka_producer_by_envs()
-    except Exception as e:
-        logging.error(f"Failed to create KafkaProducer: {e}")
-        app_producer = None
+    # If producer can't be created now, manager keeps retrying in the background
+    await app_producer_manager.start()
     logging.info(
         "Ready to go, listening to endpoints: {}".format(
             ", ".join(endpoints.keys())
@@ -61,8 +85,13 @@ async def lifespan(app: FastAPI):
 
     # Close KafkaProducer and other connections.
     logging.info("Shutdown, close connections")
-    if app_producer:
-        await app_producer.stop()
+    if app_send_tasks:
+        logging.info(f"Waiting for {len(app_send_tasks)} pending Kafka deliveries")
+        await asyncio.gather(*app_send_tasks, return_exceptions=True)
+    await app_producer_manager.stop()
+    await app_registry_client.close()
+    if app_capture:
+        app_capture.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -79,49 +108,39 @@ async def get_endpoints_from_device_registry(fail_on_error: bool) -> dict:
     Update endpoints from device registry. This is done on startup and when device registry is updated.
     """
     endpoints = {}
-    data = {}
     if ENDPOINT_CONFIG_URL.startswith("http"):
-        # Create request to ENDPOINTS_URL and get data using httpx
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    ENDPOINT_CONFIG_URL, headers=device_registry_request_headers
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    logging.info(
-                        f"Got {len(data['endpoints'])} endpoints from device registry {ENDPOINT_CONFIG_URL}"
-                    )
-                else:
-                    logging.error(
-                        f"Failed to get endpoints from device registry {ENDPOINT_CONFIG_URL}"
-                    )
-                    return endpoints
-            except Exception as e:
-                logging.error(
-                    f"Failed to get endpoints from device registry {ENDPOINT_CONFIG_URL}: {e}"
-                )
-                if fail_on_error:
-                    raise e
+        # Registry client retries and falls back to last good config by itself
+        try:
+            data = await app_registry_client.get_config()
+            logging.info(
+                f"Got {len(data['endpoints'])} endpoints from device registry {ENDPOINT_CONFIG_URL}"
+            )
+        except RegistryUnavailable as e:
+            logging.error(str(e))
+            if fail_on_error:
+                raise e
+            return endpoints
     else:
         with open(ENDPOINT_CONFIG_URL, "r") as file:
-            return json.loads(file.read())
-    for endpoint in data["endpoints"]:
-        logging.debug(f"{endpoint}")
+            data = json.loads(file.read())
+    for endpoint_data in data["endpoints"]:
+        logging.debug(f"{endpoint_data}")
+        endpoint = EndpointConfig(endpoint_data)
         # Import requesthandler module. It must exist in python path.
+        # Unchanged handlers are reused, new versions are loaded and warmed up here before use.
+        endpoint.request_handler = await app_handler_loader.get_handler(endpoint)
+        # Compile payload validation rules once here instead of per request
         try:
-            request_handler_module = importlib.import_module(
-                endpoint["http_request_handler"]
+            endpoint.payload_validator = compile_payload_validator(
+                endpoint.properties
             )
-            request_handler_function: RequestHandler = (
-                request_handler_module.RequestHandler()
-            )
-            endpoint["request_handler"] = request_handler_function
-            logging.info(f"Imported {endpoint['http_request_handler']}")
-        except ImportError as e:
+        except ValueError as e:
+            # Fail closed: reject all requests rather than accept unvalidated payloads
             logging.error(
-                f"Failed to import {endpoint['http_request_handler']}: {e}")
-        endpoints[endpoint["endpoint_path"]] = endpoint
+                f"Invalid payload validation rules in {endpoint.endpoint_path}: {e}")
+            endpoint.payload_validator = reject_invalid_config
+            endpoint.config_error = str(e)
+        endpoints[endpoint.endpoint_path] = endpoint
     return endpoints
 
 
@@ -133,19 +152,36 @@ async def root(_request: Request) -> Response:
 @app.get("/notify")
 async def notify(_request: Request) -> Response:
     global app_endpoints
-    endpoints = await get_endpoints_from_device_registry(False)
-    logging.debug("Got endpoints:\n" + pprint.pformat(endpoints))
-    endpoint_count = len(endpoints)
-    if endpoints:
-        logging.info(
-            f"Got {endpoint_count} endpoints from device registry in notify")
-        app_endpoints = endpoints
+    async with app_notify_lock:
+        endpoints = await get_endpoints_from_device_registry(False)
+        logging.debug("Got endpoints:\n" + pprint.pformat(endpoints))
+        endpoint_count = len(endpoints)
+        if endpoints:
+            logging.info(
+                f"Got {endpoint_count} endpoints from device registry in notify")
+            app_endpoints = endpoints
+            # Old handler instances are closed after their in-flight requests have finished
+            app_handler_loader.retire_unused(app_endpoints)
+            app_stats.retain(app_endpoints)
+    # Report broken endpoint configs back to the caller (Device registry), these endpoints reject all requests
+    config_errors = [f"{e.endpoint_path}: {e.config_error}" for e in endpoints.values() if e.config_error]
+    if config_errors:
+        return PlainTextResponse(
+            f"Loaded {endpoint_count} endpoints, {len(config_errors)} with invalid config:\n"
+            + "\n".join(config_errors),
+            status_code=422,
+        )
     return PlainTextResponse(f"OK ({endpoint_count})")
 
 
 @app.get("/readiness")
 @app.head("/readiness")
 async def readiness(_request: Request) -> Response:
+    if not app_producer_manager.ready:
+        status = app_producer_manager.status()
+        return PlainTextResponse(
+            f"Kafka producer not ready ({status['state']}): {status['last_error']}", status_code=503
+        )
     return PlainTextResponse("OK")
 
 
@@ -155,6 +191,46 @@ async def liveness(_request: Request) -> Response:
     return PlainTextResponse("OK")
 
 
+@app.get("/status/{request_id}")
+async def delivery_status(request_id: str) -> Response:
+    """Return Kafka delivery status of an asynchronously acknowledged request."""
+    delivery = app_delivery_tracker.get(request_id)
+    if delivery is None:
+        return JSONResponse({"request_id": request_id, "status": "unknown"}, status_code=404)
+    return JSONResponse(delivery)
+
+
+def is_admin(request: Request) -> bool:
+    authorization = request.headers.get("authorization", "").encode("utf-8")
+    return secrets.compare_digest(authorization, f"Token {ADMIN_TOKEN}".encode("utf-8"))
+
+
+@app.get("/stats")
+async def stats(request: Request) -> Response:
+    """
+    Return rolling window request statistics of all endpoints.
+    Requires header "Authorization: Token <ADMIN_TOKEN>".
+    """
+    if not ADMIN_TOKEN:
+        return PlainTextResponse("Forbidden, ADMIN_TOKEN is not set", status_code=403)
+    if not is_admin(request):
+        return PlainTextResponse("Unauthorized", status_code=401)
+    try:
+        top_n = int(request.query_params.get("top", "10"))
+    except ValueError:
+        top_n = -1
+    if top_n < 0:
+        return PlainTextResponse("Invalid top, expected a non-negative integer", status_code=400)
+    # At most top_k devices are tracked
+    top_n = min(top_n, app_stats.top_k)
+    return JSONResponse(
+        {
+            "endpoints": app_stats.snapshot(app_endpoints, top_n),
+            "payload_rejections": dict(validation.rejections),
+        }
+    )
+
+
 @app.get("/debug-sentry")
 @app.head("/debug-sentry")
 async def trigger_error(_request: Request) -> Response:
@@ -162,39 +238,60 @@ async def trigger_error(_request: Request) -> Response:
     return PlainTextResponse("Shouldn't reach this")
 
 
-async def api_v2(request: Request, endpoint: dict) -> Response:
-    global app_producer
-    request_data = await extract_data_from_starlette_request(
-        request
-    )  # data validation done here
-    # TODO : remove
-    # DONE
-    # logging.error(request_data)
-    if request_data.get("extra"):
-        logging.warning(
-            f"RequestModel contains extra values: {request_data['extra']}")
-    if request_data["request"].get("extra"):
-        logging.warning(
-            f"RequestData contains extra values: {request_data['request']['extra']}"
+async def send_and_track(producer, request_id: str, topic_name: str, packed_data: bytes):
+    """Send data to Kafka and record the result in delivery tracker."""
+    try:
+        res = await producer.send_and_wait(topic_name, value=packed_data)
+        on_send_success(res)
+        app_delivery_tracker.delivered(request_id, res)
+    except Exception as e:
+        on_send_error(e)
+        app_delivery_tracker.failed(request_id, e)
+
+
+async def api_v2(request: Request, endpoint: EndpointConfig) -> Response:
+    path = get_full_path(request)
+    if endpoint.request_handler is None:
+        logging.error(f'No request handler for "{path}", check {endpoint.http_request_handler}')
+        return PlainTextResponse("Internal server error, see logs for details", status_code=500)
+    request_view = RequestView(request, path, await request.body())
+    started = time.perf_counter()
+    device_id = None
+    try:
+        (auth_ok, device_id, topic_name, response_message, status_code) = await (
+            endpoint.request_handler.process_request(request_view, endpoint)
         )
-    path = request_data["path"]
-    (auth_ok, device_id, topic_name, response_message, status_code) = await endpoint[
-        "request_handler"
-    ].process_request(request_data, endpoint)
+    finally:
+        # Failed requests are included in latency too
+        app_stats.get(path).record_handler(time.perf_counter() - started, device_id)
     response_message = str(response_message)
-    print("REMOVE ME", auth_ok, device_id,
-          topic_name, response_message, status_code)
-    # add extracted device id to request data before pushing to kafka raw data topic
-    request_data["device_id"] = device_id
-    # We assume device data is valid here
-    logging.debug(pprint.pformat(request_data))
     if auth_ok and topic_name:
-        if app_producer:
+        if app_producer_manager.producer:
+            # Kafka message is built from the request view, only for requests which are produced
+            # Extracted device id is added to request data before pushing to kafka raw data topic
+            request_data = request_view.to_dict(device_id)
+            # We assume device data is valid here
+            logging.debug(pprint.pformat(request_data))
             logging.info(f'Sending path "{path}" data to {topic_name}')
             packed_data = data_pack(request_data) or {}
             logging.debug(packed_data[:1000])
+            # Take the current producer once, it may be replaced by the producer manager meanwhile
+            producer = app_producer_manager.producer
+            if endpoint.async_ack:
+                request_id = app_delivery_tracker.add(path, topic_name)
+                if len(app_send_tasks) < MAX_PENDING_SENDS:
+                    task = asyncio.create_task(send_and_track(producer, request_id, topic_name, packed_data))
+                    app_send_tasks.add(task)
+                    task.add_done_callback(app_send_tasks.discard)
+                else:
+                    # Kafka is slow: send synchronously, so clients are slowed down instead of pending sends
+                    # (and memory use) growing without limit
+                    await send_and_track(producer, request_id, topic_name, packed_data)
+                response = PlainTextResponse(response_message, status_code=status_code or 202)
+                response.headers["X-Request-Id"] = request_id
+                return response
             try:
-                res = await app_producer.send_and_wait(topic_name, value=packed_data)
+                res = await producer.send_and_wait(topic_name, value=packed_data)
                 on_send_success(res)
             except Exception as e:
                 on_send_error(e)
@@ -221,7 +318,23 @@ async def catch_all(request: Request) -> Response:
     # print(full_path, app_endpoints.keys())
     if full_path in app_endpoints:
         endpoint = app_endpoints[full_path]
-        response = await api_v2(request, endpoint)
+        # Count the request before the first await, so that a concurrent /notify can't close the handler under it
+        request_handler = endpoint.request_handler
+        if request_handler is not None:
+            app_handler_loader.acquire(request_handler)
+        # Unhandled exceptions become 500 responses in the server, record them as such
+        status_code, bytes_in, bytes_out = 500, 0, 0
+        try:
+            bytes_in = len(await request.body())
+            # Capture only requests to known endpoints, not scanners probing random paths
+            if app_capture:
+                await app_capture.sample(request, full_path)
+            response = await api_v2(request, endpoint)
+            status_code, bytes_out = response.status_code, len(response.body)
+        finally:
+            if request_handler is not None:
+                app_handler_loader.release(request_handler)
+            app_stats.get(full_path).record_response(status_code, bytes_in, bytes_out)
         return response
     else:  # return 404
         return PlainTextResponse("Not found: " + full_path, status_code=404)
@@ -0,0 +1,128 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import re
+import sys
+from collections import Counter
+from types import ModuleType
+from typing import Union
+
+from endpoints import AsyncRequestHandler as RequestHandler
+from endpoints.models import EndpointConfig
+
+
+def import_versioned_module(module_path: str, version: str) -> ModuleType:
+    """
+    Execute the current source of module_path as a separate module named "module_path@version",
+    so that different versions of the same handler module can be in use at the same time.
+    """
+    spec = importlib.util.find_spec(module_path)
+    if spec is None or spec.origin is None:
+        raise ImportError(f"No module named '{module_path}'")
+    # Version must not contain dots, the parent package (for relative imports) is taken from the name
+    name = f"{module_path}@{re.sub(r'[^0-9A-Za-z_-]', '_', version)}"
+    versioned_spec = importlib.util.spec_from_file_location(name, spec.origin)
+    module = importlib.util.module_from_spec(versioned_spec)
+    sys.modules[name] = module
+    try:
+        versioned_spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+class HandlerLoader:
+    """
+    Load request handlers by module path and version.
+
+    Unversioned handlers ("endpoints.sentilo.cesva") are imported normally and never reloaded.
+    A versioned handler ("endpoints.sentilo.cesva@2") is loaded from the module's source on disk
+    the first time that version is seen, as its own module, so old and new versions run side by side.
+    A new handler instance is warmed up before it is taken into use, and replaced instances are
+    closed after their in-flight requests have finished.
+    """
+
+    def __init__(self, drain_timeout: float = 30.0):
+        self.drain_timeout = drain_timeout
+        # (module path, version) -> versioned module
+        self.modules: dict = {}
+        # (endpoint path, module path, version) -> handler instance
+        self.handlers: dict = {}
+        # handler instance -> number of requests it is processing, entries are removed when they reach 0
+        self.in_flight: Counter = Counter()
+        self.drain_tasks = set()
+
+    def load_module(self, module_path: str, version: Union[str, None]) -> ModuleType:
+        if version is None:
+            return importlib.import_module(module_path)
+        module = self.modules.get((module_path, version))
+        if module is None:
+            logging.info(f"Loading {module_path} version {version}")
+            module = self.modules[(module_path, version)] = import_versioned_module(module_path, version)
+        return module
+
+    async def get_handler(self, endpoint: EndpointConfig) -> Union[RequestHandler, None]:
+        """
+        Return handler for endpoint, reusing the current instance if module and version are unchanged.
+        If the module can't be loaded or the new handler fails to warm up, return the endpoint's
+        previous handler or None, if there is none.
+        """
+        module_path = endpoint.http_request_handler
+        version = endpoint.http_request_handler_version
+        key = (endpoint.endpoint_path, module_path, version)
+        if key in self.handlers:
+            return self.handlers[key]
+        try:
+            module = self.load_module(module_path, version)
+            handler: RequestHandler = module.RequestHandler()
+            await handler.warm_up(endpoint)
+        except Exception as e:
+            logging.error(f"Failed to load {module_path} (version {version}): {e}")
+            # Keep serving with the previous handler of this endpoint, if there is one
+            for (endpoint_path, *_), previous in self.handlers.items():
+                if endpoint_path == endpoint.endpoint_path:
+                    logging.warning(f"Keeping previous handler {type(previous).__module__} for {endpoint_path}")
+                    return previous
+            return None
+        self.handlers[key] = handler
+        logging.info(f"Imported {module_path} (version {version})")
+        return handler
+
+    def acquire(self, handler: RequestHandler):
+        """Mark a request started on handler. Call before the first await of the request."""
+        self.in_flight[handler] += 1
+
+    def release(self, handler: RequestHandler):
+        self.in_flight[handler] -= 1
+        if self.in_flight[handler] <= 0:
+            del self.in_flight[handler]
+
+    def retire_unused(self, endpoints: dict):
+        """Forget handlers and modules not used by given endpoints, close the handlers after draining."""
+        used = {id(endpoint.request_handler) for endpoint in endpoints.values()}
+        for key, handler in list(self.handlers.items()):
+            if id(handler) not in used:
+                del self.handlers[key]
+                task = asyncio.create_task(self.drain(handler))
+                self.drain_tasks.add(task)
+                task.add_done_callback(self.drain_tasks.discard)
+        used_modules = {type(handler).__module__ for handler in self.handlers.values()}
+        for key, module in list(self.modules.items()):
+            if module.__name__ not in used_modules:
+                # Draining handlers keep a reference to their module as long as they need it
+                del self.modules[key]
+                sys.modules.pop(module.__name__, None)
+
+    async def drain(self, handler: RequestHandler):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while self.in_flight[handler] > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight[handler] > 0:
+            logging.warning(f"{type(handler).__module__} still has {self.in_flight[handler]} requests, closing anyway")
+        try:
+            await handler.close()
+        except Exception as e:
+            logging.warning(f"Failed to close {type(handler).__module__} handler: {e}")
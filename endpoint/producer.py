@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Union
+
+from aiokafka import AIOKafkaProducer
+from fvhiot.utils.aiokafka import get_aiokafka_producer_by_envs
+
+
+class ProducerManager:
+    """
+    Supervise the Kafka producer: retry creation in the background with backoff, check broker metadata
+    periodically and replace the producer with a fresh one if the connection stays broken.
+    The old producer is stopped only after the new one is in use, so in-flight sends are flushed, not dropped.
+    """
+
+    def __init__(
+        self,
+        health_interval: float = 15.0,
+        health_timeout: float = 10.0,
+        max_failures: int = 3,
+        max_backoff: float = 60.0,
+    ):
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_failures = max_failures
+        self.max_backoff = max_backoff
+        self.producer: Union[AIOKafkaProducer, None] = None
+        self.state = "stopped"
+        self.failures = 0
+        self.last_error: Union[str, None] = None
+        self.task: Union[asyncio.Task, None] = None
+        self.old_producer_tasks = set()
+
+    @classmethod
+    def from_envs(cls) -> "ProducerManager":
+        return cls(
+            health_interval=float(os.getenv("KAFKA_HEALTH_INTERVAL", "15")),
+            health_timeout=float(os.getenv("KAFKA_HEALTH_TIMEOUT", "10")),
+            max_failures=int(os.getenv("KAFKA_HEALTH_MAX_FAILURES", "3")),
+            max_backoff=float(os.getenv("KAFKA_MAX_BACKOFF", "60")),
+        )
+
+    @property
+    def ready(self) -> bool:
+        """
+        Producer is usable. Single failed health checks don't make it unready,
+        only reaching max_failures (while a replacement can't be created) does.
+        """
+        return self.producer is not None and self.failures < self.max_failures
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "state": self.state, "failures": self.failures, "last_error": self.last_error}
+
+    async def start(self):
+        """Try to create the producer once and keep supervising it in the background."""
+        self.state = "starting"
+        await self.create_producer()
+        self.task = asyncio.create_task(self.supervise())
+
+    async def stop(self):
+        self.state = "stopped"
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.old_producer_tasks:
+            await asyncio.gather(*self.old_producer_tasks, return_exceptions=True)
+        if self.producer:
+            await self.producer.stop()
+            self.producer = None
+
+    async def create_producer(self) -> bool:
+        try:
+            producer = await get_aiokafka_producer_by_envs()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logging.error(f"Failed to create KafkaProducer: {e}")
+            return False
+        old_producer, self.producer = self.producer, producer
+        self.state = "connected"
+        self.failures = 0
+        self.last_error = None
+        logging.info("KafkaProducer connected")
+        if old_producer is not None:
+            # Flush and close old producer in background, sends started with it still complete
+            task = asyncio.create_task(self.stop_producer(old_producer))
+            self.old_producer_tasks.add(task)
+            task.add_done_callback(self.old_producer_tasks.discard)
+        return True
+
+    @staticmethod
+    async def stop_producer(producer: AIOKafkaProducer):
+        try:
+            await producer.stop()
+        except Exception as e:
+            logging.warning(f"Failed to stop old KafkaProducer: {e}")
+
+    async def check_health(self) -> bool:
+        """Check that broker metadata can be fetched with current producer."""
+        try:
+            await asyncio.wait_for(self.producer.client.fetch_all_metadata(), self.health_timeout)
+            return True
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            logging.warning(f"KafkaProducer health check failed: {self.last_error}")
+            return False
+
+    async def supervise(self):
+        while True:
+            if self.producer is None:
+                delay = min(self.max_backoff, 2 ** min(self.failures, 16))
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                self.state = "reconnecting"
+                await self.create_producer()
+                continue
+            await asyncio.sleep(self.health_interval)
+            if await self.check_health():
+                self.failures = 0
+                self.state = "connected"
+                continue
+            self.failures += 1
+            self.state = "unhealthy"
+            if self.failures >= self.max_failures:
+                logging.error(f"KafkaProducer unhealthy after {self.failures} checks, replacing it")
+                self.state = "reconnecting"
+                if not await self.create_producer():
+                    # Keep using the old producer until a new one can be created
+                    self.state = "unhealthy"
+                    delay = min(self.max_backoff, 2 ** min(self.failures, 16))
+                    await asyncio.sleep(random.uniform(0, delay))
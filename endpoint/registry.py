@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Union
+
+import httpx
+
+
+class RegistryUnavailable(Exception):
+    """Device registry could not be reached and there is no last good config to fall back to."""
+
+
+class DeviceRegistryClient:
+    """
+    Persistent Device registry client, which reuses pooled connections, retries failed requests with
+    jittered exponential backoff and stops calling the registry for a while after repeated failures
+    (circuit breaker). The last successfully fetched config is kept in memory and optionally in a cache file,
+    so it can be used while the registry is unavailable, also after a restart.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict,
+        timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        cache_file: str = "",
+        transport: Union[httpx.AsyncBaseTransport, None] = None,
+    ):
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache_file = cache_file
+        self.transport = transport
+        self.client: Union[httpx.AsyncClient, None] = None
+        self.last_good: Union[dict, None] = None
+        self.failures = 0
+        self.opened_at: Union[float, None] = None
+        # Fetch in progress, concurrent callers (e.g. a /notify storm) share its result
+        self.fetch_task: Union[asyncio.Task, None] = None
+
+    @classmethod
+    def from_envs(cls, url: str, headers: dict) -> "DeviceRegistryClient":
+        return cls(
+            url,
+            headers,
+            timeout=float(os.getenv("DEVICE_REGISTRY_TIMEOUT", "10")),
+            retries=int(os.getenv("DEVICE_REGISTRY_RETRIES", "3")),
+            backoff=float(os.getenv("DEVICE_REGISTRY_BACKOFF", "0.5")),
+            failure_threshold=int(os.getenv("DEVICE_REGISTRY_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("DEVICE_REGISTRY_RESET_TIMEOUT", "30")),
+            cache_file=os.getenv("DEVICE_REGISTRY_CACHE_FILE", ""),
+        )
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            transport=self.transport,
+        )
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    @property
+    def circuit_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Half-open: let the next request through to test if the registry has recovered
+            return False
+        return True
+
+    async def get_config(self) -> dict:
+        """
+        Get host config (including endpoints) from the Device registry.
+        Fall back to last good config if the registry is unavailable.
+        :raise RegistryUnavailable: if the registry is unavailable and there is no fallback config
+        """
+        if self.fetch_task is None:
+            self.fetch_task = asyncio.create_task(self._get_config())
+            self.fetch_task.add_done_callback(self._clear_fetch_task)
+        # Shield, so a cancelled caller doesn't cancel the fetch other callers are waiting for
+        return await asyncio.shield(self.fetch_task)
+
+    def _clear_fetch_task(self, task: asyncio.Task):
+        if self.fetch_task is task:
+            self.fetch_task = None
+
+    async def _get_config(self) -> dict:
+        if self.circuit_open:
+            logging.warning(f"Device registry circuit is open, not calling {self.url}")
+            return self.get_fallback_config()
+        if self.client is None:
+            await self.start()
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            try:
+                response = await self.client.get(self.url)
+                response.raise_for_status()
+                data = response.json()
+                # Don't replace the last good config with e.g. a maintenance message
+                if not isinstance(data, dict) or not isinstance(data.get("endpoints"), list):
+                    raise ValueError("Response has no endpoints list")
+                self.on_success(data)
+                return data
+            except (httpx.HTTPError, ValueError) as e:
+                error = e
+                logging.warning(f"Device registry request {attempt + 1}/{self.retries + 1} to {self.url} failed: {e}")
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                    break  # Client errors won't be fixed by retrying
+        self.on_failure()
+        logging.error(f"Failed to get endpoints from device registry {self.url}: {error}")
+        return self.get_fallback_config()
+
+    def on_success(self, data: dict):
+        self.failures = 0
+        self.opened_at = None
+        self.last_good = data
+        if self.cache_file:
+            try:
+                with open(self.cache_file, "w") as file:
+                    json.dump(data, file)
+            except OSError as e:
+                logging.warning(f"Failed to write device registry cache file {self.cache_file}: {e}")
+
+    def on_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logging.error(f"Device registry failed {self.failures} times, opening circuit")
+            self.opened_at = time.monotonic()
+
+    def get_fallback_config(self) -> dict:
+        if self.last_good is None and self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as file:
+                    self.last_good = json.loads(file.read())
+                logging.info(f"Loaded last good device registry config from {self.cache_file}")
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to read device registry cache file {self.cache_file}: {e}")
+        if self.last_good is None:
+            raise RegistryUnavailable(f"Device registry {self.url} is unavailable and no fallback config exists")
+        logging.warning("Using last good device registry config")
+        return self.last_good
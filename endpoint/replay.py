@@ -0,0 +1,111 @@
+"""
+Replay captured production traffic against an endpoint instance, e.g.
+
+    python -m endpoint.replay capture.ndjson --base-url http://localhost:8000 --speed 2 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+
+import httpx
+
+from .capture import get_record_body, read_capture
+
+# Headers which are set by the HTTP client for the replayed request
+SKIPPED_HEADERS = {"host", "content-length", "connection", "transfer-encoding"}
+
+
+async def replay(
+    records: list, base_url: str, speed: float, concurrency: int, transport: httpx.AsyncBaseTransport = None
+) -> dict:
+    """
+    Send captured requests to base_url keeping their original relative timing, divided by speed.
+    Speed 0 sends requests as fast as concurrency allows.
+    :param transport: custom httpx transport, e.g. for testing
+    """
+    if concurrency < 1:
+        raise ValueError(f"Concurrency must be at least 1, got {concurrency}")
+    if speed < 0:
+        raise ValueError(f"Speed must not be negative, got {speed}")
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = Counter()
+    latencies = []
+    if not records:
+        return {"statuses": statuses, "latencies": latencies}
+    first_ts = records[0]["ts"]
+
+    async def send(client: httpx.AsyncClient, record: dict):
+        headers = {k: v for k, v in record["headers"].items() if k.lower() not in SKIPPED_HEADERS}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    record["method"],
+                    record["path"],
+                    params=record["query"],
+                    headers=headers,
+                    content=get_record_body(record),
+                )
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                logging.warning(f"Replaying {record['method']} {record['path']} failed: {e}")
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, transport=transport) as client:
+        tasks = []
+        started = time.monotonic()
+        for record in records:
+            if speed > 0:
+                delay = (record["ts"] - first_ts) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(client, record)))
+        await asyncio.gather(*tasks)
+    return {"statuses": statuses, "latencies": latencies}
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured requests against an endpoint instance")
+    parser.add_argument("files", nargs="+", help="Capture NDJSON file(s)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Endpoint instance to replay against")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed multiplier, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=10, help="Max concurrent requests")
+    parser.add_argument("--log", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.speed < 0:
+        parser.error("--speed must not be negative")
+    logging.basicConfig(level=getattr(logging, args.log))
+
+    records = []
+    for filename in args.files:
+        records += read_capture(filename)
+    records.sort(key=lambda r: r["ts"])
+    logging.info(f"Replaying {len(records)} requests to {args.base_url} at {args.speed}x speed")
+    started = time.monotonic()
+    result = asyncio.run(replay(records, args.base_url, args.speed, args.concurrency))
+    duration = time.monotonic() - started
+    latencies = result["latencies"]
+    print(f"Sent {len(latencies)} requests in {duration:.1f} s ({len(latencies) / max(duration, 1e-9):.1f} req/s)")
+    print("Statuses: " + ", ".join(f"{k}: {v}" for k, v in sorted(result["statuses"].items(), key=str)))
+    print(
+        "Latency p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms".format(
+            *(percentile(latencies, p) * 1000 for p in (0.5, 0.95, 0.99))
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import math
+import time
+from collections import Counter
+from typing import Union
+
+
+class LatencyHistogram:
+    """
+    Fixed size histogram with logarithmic buckets (HDR histogram style), values in seconds.
+    Relative error of percentiles is about half of the bucket growth factor.
+    """
+
+    MIN_VALUE = 1e-5  # 10 µs
+    GROWTH = 1.05
+    BUCKETS = 400  # up to ~ 47 minutes (1e-5 * 1.05 ** 399 s)
+    LOG_GROWTH = math.log(GROWTH)
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0
+
+    def add(self, value: float):
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(self.BUCKETS - 1, int(math.log(value / self.MIN_VALUE) / self.LOG_GROWTH) + 1)
+        self.counts[index] += 1
+        self.total += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts, strict=True)]
+        self.total += other.total
+
+    def percentile(self, p: float) -> Union[float, None]:
+        if self.total == 0:
+            return None
+        rank = p * self.total
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                # Upper bound of the bucket
+                return self.MIN_VALUE * self.GROWTH**index
+        return self.MIN_VALUE * self.GROWTH ** (self.BUCKETS - 1)
+
+
+class SpaceSaving:
+    """Space-saving top-k counter: keeps at most k keys, counts of heavy hitters are overestimated at most by min."""
+
+    __slots__ = ("k", "counts")
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: dict = {}
+
+    def add(self, key: str, weight: int = 1):
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.k:
+            self.counts[key] = weight
+        else:
+            # Replace the smallest key, new key inherits its count
+            min_key = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(min_key) + weight
+
+    def merge(self, other: "SpaceSaving"):
+        for key, count in other.counts.items():
+            self.add(key, count)
+
+
+class StatsSlot:
+    __slots__ = ("started", "requests", "statuses", "bytes_in", "bytes_out", "latency", "devices")
+
+    def __init__(self, started: float, top_k: int):
+        self.started = started
+        self.requests = 0
+        self.statuses = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+        self.devices = SpaceSaving(top_k)
+
+
+class EndpointStats:
+    """
+    Rolling window statistics of one endpoint. The window is divided into slots,
+    the oldest slot is reset when time moves on, so memory use stays constant.
+    """
+
+    def __init__(self, window: float = 60.0, slot_count: int = 6, top_k: int = 20):
+        self.window = window
+        self.slot_length = window / slot_count
+        self.top_k = top_k
+        self.slots = [StatsSlot(0.0, top_k) for _ in range(slot_count)]
+
+    def current_slot(self, now: float) -> StatsSlot:
+        started = now - now % self.slot_length
+        index = int(now // self.slot_length) % len(self.slots)
+        slot = self.slots[index]
+        if slot.started != started:
+            slot = self.slots[index] = StatsSlot(started, self.top_k)
+        return slot
+
+    def record_handler(self, latency: float, device_id: Union[str, None]):
+        slot = self.current_slot(time.time())
+        slot.latency.add(latency)
+        if device_id:
+            slot.devices.add(str(device_id))
+
+    def record_response(self, status_code: int, bytes_in: int, bytes_out: int):
+        slot = self.current_slot(time.time())
+        slot.requests += 1
+        slot.statuses[status_code] += 1
+        slot.bytes_in += bytes_in
+        slot.bytes_out += bytes_out
+
+    def snapshot(self, top_n: int = 10) -> dict:
+        now = time.time()
+        oldest = now - now % self.slot_length - self.slot_length * (len(self.slots) - 1)
+        live = [slot for slot in self.slots if slot.started >= oldest]
+        requests = sum(slot.requests for slot in live)
+        statuses = Counter()
+        latency = LatencyHistogram()
+        devices = SpaceSaving(self.top_k)
+        for slot in live:
+            statuses.update(slot.statuses)
+            latency.merge(slot.latency)
+            devices.merge(slot.devices)
+        # Current slot is only partially elapsed
+        elapsed = max(now - oldest, 1e-9)
+        return {
+            "window_seconds": round(elapsed, 1),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 3),
+            "error_rate_by_status": {
+                str(status): round(count / requests, 4) for status, count in sorted(statuses.items()) if status >= 400
+            },
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            "handler_latency_ms": {
+                f"p{int(p * 100)}": None if latency.percentile(p) is None else round(latency.percentile(p) * 1000, 3)
+                for p in (0.5, 0.95, 0.99)
+            },
+            "bytes_in": sum(slot.bytes_in for slot in live),
+            "bytes_out": sum(slot.bytes_out for slot in live),
+            "top_devices": [
+                {"device_id": device_id, "requests": count}
+                for device_id, count in sorted(devices.counts.items(), key=lambda i: i[1], reverse=True)[:top_n]
+            ],
+        }
+
+
+class StatsRegistry:
+    """Rolling window statistics for all endpoints, keyed by endpoint path."""
+
+    def __init__(self, window: float = 60.0, slot_count: int = 6, top_k: int = 20):
+        self.window = window
+        self.slot_count = slot_count
+        self.top_k = top_k
+        self.endpoints: dict = {}
+
+    def get(self, path: str) -> EndpointStats:
+        stats = self.endpoints.get(path)
+        if stats is None:
+            stats = self.endpoints[path] = EndpointStats(self.window, self.slot_count, self.top_k)
+        return stats
+
+    def retain(self, paths):
+        """Drop statistics of endpoints which no longer exist."""
+        for path in list(self.endpoints):
+            if path not in paths:
+                del self.endpoints[path]
+
+    def snapshot(self, paths, top_n: int = 10) -> dict:
+        return {path: self.get(path).snapshot(top_n) for path in paths}
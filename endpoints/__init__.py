@@ -4,8 +4,11 @@ import logging
 import os
 from typing import Tuple, Union
 
+from .models import EndpointConfig, RequestView
+from .validation import INVALID_CONFIG, validate_payload
 
-def is_ip_address_allowed(request_data: dict, allowed_ip_addresses: str):
+
+def is_ip_address_allowed(request_data: RequestView, allowed_ip_addresses: str):
     """
     Check if the request IP address is in the allowed IP addresses list.
     """
@@ -20,24 +23,16 @@ def is_ip_address_allowed(request_data: dict, allowed_ip_addresses: str):
     for a_ip in allowed_ips:
         try:
             allowed_network = ipaddress.ip_network(a_ip, strict=False)
-            r_ip = request_data["remote_addr"]
+            r_ip = request_data.remote_addr
             if ipaddress.ip_address(r_ip) in allowed_network:
                 log_match("remote_addr", r_ip, allowed_network)
                 return True
-            r_ip = request_data["request"]["headers"].get("x-real-ip")
-            if (
-                r_ip
-                and ipaddress.ip_address(
-                    request_data["request"]["headers"].get("x-real-ip", "")
-                )
-                in allowed_network
-            ):
+            r_ip = request_data.headers.get("x-real-ip")
+            if r_ip and ipaddress.ip_address(r_ip) in allowed_network:
                 log_match("x-real-ip", r_ip, allowed_network)
                 return True
 
-            forwarded_for_ips = (
-                request_data["request"]["headers"].get("x-forwarded-for", "").split(",")
-            )
+            forwarded_for_ips = request_data.headers.get("x-forwarded-for", "").split(",")
             for r_ip in forwarded_for_ips:
                 r_ip = r_ip.strip()
                 if a_ip:
@@ -57,23 +52,23 @@ class AsyncRequestHandler(abc.ABC):
 
     @abc.abstractmethod
     async def validate(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, Union[str, None], Union[int, None]]:
         """
         Use Starlette request_data here to determine should we accept or reject
         this request
-        :param request_data: deserialized (FastAPI) Starlette Request
+        :param request_data: view of (FastAPI) Starlette Request
         :param endpoint_data: endpoint data from device registry
         :return: (bool ok, str error text, int status code)
         """
         # Reject requests not matching the one defined in env
-        if request_data["path"] != endpoint_data["endpoint_path"]:
+        if request_data.path != endpoint_data.endpoint_path:
             return False, "Not found", 404
         # Reject requests without token parameter, which can be in query string or http header
-        api_key = request_data["request"]["get"].get("x-api-key")
+        api_key = request_data.query.get("x-api-key")
         if api_key is None:
-            api_key = request_data["request"]["headers"].get("x-api-key")
-        if api_key is None or api_key != endpoint_data["auth_token"]:
+            api_key = request_data.headers.get("x-api-key")
+        if api_key is None or api_key != endpoint_data.auth_token:
             logging.warning("Missing or invalid authentication token (x-api-key)")
             return (
                 False,
@@ -81,10 +76,10 @@ class AsyncRequestHandler(abc.ABC):
                 401,
             )
         logging.info("Authentication token validated")
-        if request_data["request"]["get"].get("test") == "true":
+        if request_data.query.get("test") == "true":
             logging.info("Test ok")
             return False, "Test OK", 400
-        allowed_ip_addresses = endpoint_data.get("allowed_ip_addresses", "")
+        allowed_ip_addresses = endpoint_data.allowed_ip_addresses
         if allowed_ip_addresses == "":
             logging.warning(
                 "Set 'allowed_ip_addresses' in endpoint settings to restrict requests unknown sources"
@@ -92,13 +87,18 @@ class AsyncRequestHandler(abc.ABC):
         else:
             if is_ip_address_allowed(request_data, allowed_ip_addresses) is False:
                 return False, "IP address not allowed", 403
+        payload_ok, error_type = validate_payload(request_data, endpoint_data)
+        if payload_ok is False:
+            if error_type == INVALID_CONFIG:
+                return False, "Invalid payload validation rules in endpoint config, see logs for error", 500
+            return False, f"Invalid payload ({error_type})", 400
 
         # if all checks passed, return True
         return True, None, None
 
     @abc.abstractmethod
     async def process_request(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, Union[str, None], Union[str, None], Union[str, dict, list], int]:
         """
         Validate request and generate response
@@ -118,8 +118,19 @@ class AsyncRequestHandler(abc.ABC):
         status_code = 200
         return auth_ok, device_id, topic_name, response_message, status_code
 
+    async def warm_up(self, endpoint_data: EndpointConfig):
+        """
+        Prepare a new handler instance before it starts receiving requests, e.g. open connections.
+        Raise an exception to keep using the previous handler.
+        """
+        return None
+
+    async def close(self):
+        """Release resources after the handler has been replaced and its requests have finished."""
+        return None
+
     @abc.abstractmethod
-    async def get_metadata(self, request_data: dict, device_id: str) -> str:
+    async def get_metadata(self, request_data: RequestView, device_id: str) -> str:
         metadata = "{}"
         # Get metadata from somewhere here, if needed
         return metadata
@@ -2,17 +2,18 @@ from pprint import pprint
 from typing import Tuple, Union
 
 from .. import AsyncRequestHandler
+from ..models import EndpointConfig, RequestView
 
 
 class RequestHandler(AsyncRequestHandler):
     async def validate(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, Union[str, None], Union[int, None]]:
         """
         Use Starlette request_data and endpoint_data from the Device registry here to determine
         should we accept or reject this request.
 
-        :param request_data: deserialized Starlette Request
+        :param request_data: view of Starlette Request
         :param endpoint_data: endpoint data from the Device registry
         :return: (bool ok, str error text, int status code)
         """
@@ -21,7 +22,7 @@ class RequestHandler(AsyncRequestHandler):
         return super().validate(request_data, endpoint_data)
 
     async def process_request(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, str, Union[str, None], Union[str, dict, list], int]:
         """
         Just do minimal validation for request_data and
@@ -31,14 +32,14 @@ class RequestHandler(AsyncRequestHandler):
             request_data, endpoint_data
         )
         if auth_ok:
-            topic_name = endpoint_data["kafka_raw_data_topic"]
+            topic_name = endpoint_data.kafka_raw_data_topic
             response_message = "Request OK"
             status_code = 202
         else:
             topic_name = None
         return auth_ok, "unknown_device_id", topic_name, response_message, status_code
 
-    async def get_metadata(self, request_data: dict, device_id: str) -> str:
+    async def get_metadata(self, request_data: RequestView, device_id: str) -> str:
         metadata = "{}"
         # Get metadata from somewhere here, if needed
         return metadata
@@ -3,16 +3,17 @@ import os
 from typing import Tuple, Union
 
 from .. import AsyncRequestHandler
+from ..models import EndpointConfig, RequestView
 
 
 class RequestHandler(AsyncRequestHandler):
     async def validate(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, Union[str, None], Union[int, None]]:
         """
         Use Starlette request_data here to determine should we accept or reject
         this request
-        :param request_data: deserialized (FastAPI) Starlette Request
+        :param request_data: view of (FastAPI) Starlette Request
         :param endpoint_data: endpoint data from device registry
         :return: (bool ok, str error text, int status code)
         """
@@ -23,7 +24,7 @@ class RequestHandler(AsyncRequestHandler):
         if status_ok is False:
             return False, response_message, status_code
 
-        if request_data["request"]["get"].get("LrnDevEui") is None:
+        if request_data.query.get("LrnDevEui") is None:
             logging.warning("LrnDevEui not found in request params")
             return False, "Invalid arguments, see logs for error", 400
         else:
@@ -31,15 +32,15 @@ class RequestHandler(AsyncRequestHandler):
 
     async def process_request(
         self,
-        request_data: dict,
-        endpoint_data: dict,
+        request_data: RequestView,
+        endpoint_data: EndpointConfig,
     ) -> Tuple[bool, str, Union[str, None], Union[str, dict, list], int]:
         auth_ok, response_message, status_code = await self.validate(
             request_data, endpoint_data
         )
-        device_id = request_data["request"]["get"].get("LrnDevEui")
+        device_id = request_data.query.get("LrnDevEui")
         if device_id:  # a LrnDevEui must be present to send the data to Kafka topic
-            topic_name = endpoint_data["kafka_raw_data_topic"]
+            topic_name = endpoint_data.kafka_raw_data_topic
         else:
             topic_name = None
         logging.info(
@@ -47,7 +48,7 @@ class RequestHandler(AsyncRequestHandler):
         )
         return auth_ok, device_id, topic_name, response_message, status_code
 
-    async def get_metadata(self, request_data: dict, device_id: str) -> str:
+    async def get_metadata(self, request_data: RequestView, device_id: str) -> str:
         # TODO: put this function to BaseRequestHandler or remove from endpoint
         # (and add to parser)
         metadata = "{}"
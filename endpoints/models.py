@@ -0,0 +1,208 @@
+import json
+from datetime import datetime, timezone
+from typing import Union
+
+# Marker for RequestView payload which hasn't been parsed yet
+_UNPARSED = object()
+
+# Device registry endpoint keys stored in their own EndpointConfig slots, others go to EndpointConfig.extra
+_REGISTRY_KEYS = frozenset(
+    (
+        "id",
+        "endpoint_path",
+        "http_request_handler",
+        "auth_token",
+        "data_source",
+        "properties",
+        "allowed_ip_addresses",
+        "kafka_raw_data_topic",
+        "kafka_parsed_data_topic",
+        "kafka_group_id",
+        "host",
+    )
+)
+
+
+class EndpointConfig:
+    """
+    Compact endpoint config, created once from Device registry endpoint data.
+    Registry keys without their own slot (e.g. created_at) are kept in `extra`.
+    Supports dict style read access (endpoint_data["auth_token"], endpoint_data.get(...)) for old handlers.
+    """
+
+    __slots__ = (
+        "id",
+        "endpoint_path",
+        "http_request_handler",
+        "http_request_handler_version",
+        "auth_token",
+        "data_source",
+        "properties",
+        "allowed_ip_addresses",
+        "kafka_raw_data_topic",
+        "kafka_parsed_data_topic",
+        "kafka_group_id",
+        "host",
+        "request_handler",
+        "payload_validator",
+        "async_ack",
+        "config_error",
+        "extra",
+    )
+
+    def __init__(self, data: dict):
+        self.id = data.get("id")
+        self.endpoint_path: str = data["endpoint_path"]
+        # Handler may be versioned as "module.path@version", a new version is loaded on /notify
+        module_path, _, version = data["http_request_handler"].partition("@")
+        self.http_request_handler: str = module_path
+        self.http_request_handler_version: Union[str, None] = version or None
+        self.auth_token: Union[str, None] = data.get("auth_token")
+        self.data_source: Union[str, None] = data.get("data_source")
+        self.properties: Union[dict, None] = data.get("properties")
+        self.allowed_ip_addresses: str = data.get("allowed_ip_addresses") or ""
+        self.kafka_raw_data_topic: Union[str, None] = data.get("kafka_raw_data_topic")
+        self.kafka_parsed_data_topic: Union[str, None] = data.get("kafka_parsed_data_topic")
+        self.kafka_group_id: Union[str, None] = data.get("kafka_group_id")
+        self.host = data.get("host")
+        self.request_handler = None
+        self.payload_validator = None
+        # Problem in endpoint config (e.g. invalid validation rules), reported back to the registry in /notify
+        self.config_error: Union[str, None] = None
+        self.extra: dict = {key: value for key, value in data.items() if key not in _REGISTRY_KEYS}
+        # Respond before Kafka delivery completes and let the client query delivery status with request id
+        self.async_ack: bool = isinstance(self.properties, dict) and bool(self.properties.get("async_ack"))
+
+    def __getitem__(self, key: str):
+        if key in self.extra:
+            return self.extra[key]
+        if key in EndpointConfig.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"<EndpointConfig {self.endpoint_path} {self.http_request_handler}>"
+
+
+class RequestView:
+    """
+    Lightweight read-only view of an incoming Starlette request, passed to request handlers.
+    Headers and query parameters are taken from the request only when accessed.
+    Supports dict style access (request_data["request"]["get"]) for old handlers.
+    """
+
+    __slots__ = ("_request", "path", "body", "_headers", "_query", "_json")
+
+    def __init__(self, request, path: str, body: bytes):
+        self._request = request
+        self.path = path
+        self.body = body
+        self._headers = None
+        self._query = None
+        self._json = _UNPARSED
+
+    @property
+    def json(self):
+        """
+        Request body parsed as JSON. Parsed only once, so validators and handlers can share the result.
+        :raise ValueError: if body is not valid JSON
+        """
+        if self._json is _UNPARSED:
+            try:
+                self._json = json.loads(self.body)
+            except ValueError as e:
+                self._json = e
+        if isinstance(self._json, ValueError):
+            raise ValueError(str(self._json))
+        return self._json
+
+    @property
+    def method(self) -> str:
+        return self._request.method
+
+    @property
+    def remote_addr(self) -> Union[str, None]:
+        client = self._request.client
+        return client.host if client else None
+
+    @property
+    def headers(self):
+        """Case-insensitive header mapping (keys in lower case)."""
+        if self._headers is None:
+            self._headers = self._request.headers
+        return self._headers
+
+    @property
+    def query(self):
+        """Query parameter mapping."""
+        if self._query is None:
+            self._query = self._request.query_params
+        return self._query
+
+    def to_dict(self, device_id: Union[str, None] = None) -> dict:
+        """
+        Build request data for Kafka raw data topic directly from the request.
+        Headers and query parameters are copied only here, once per produced request.
+        The shape is consumed by downstream parsers, see tests/test_models.py before changing it.
+        :param device_id: device id extracted by the request handler
+        """
+        return {
+            "path": self._request.url.path,
+            "remote_addr": self.remote_addr,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "request": {
+                "method": self._request.method,
+                "url": str(self._request.url),
+                "headers": dict(self.headers),
+                "get": dict(self.query),
+                "body": self.body,
+            },
+            "device_id": device_id,
+        }
+
+    def __getitem__(self, key: str):
+        if key == "path":
+            return self.path
+        if key == "remote_addr":
+            return self.remote_addr
+        if key == "request":
+            return _RequestSection(self)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class _RequestSection:
+    """Dict style access to request_data["request"] fields of RequestView."""
+
+    __slots__ = ("_view",)
+
+    def __init__(self, view: RequestView):
+        self._view = view
+
+    def __getitem__(self, key: str):
+        if key == "headers":
+            return self._view.headers
+        if key == "get":
+            return self._view.query
+        if key == "body":
+            return self._view.body
+        if key == "method":
+            return self._view.method
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -1,19 +1,23 @@
 import logging
 import os
 from typing import Tuple, Union
-import json
 
 from .. import AsyncRequestHandler
+from ..models import EndpointConfig, RequestView
+from ..validation import check_payload, compile_fields, count_rejection
+
+# Device id is extracted from the first sensor's name, e.g. "TA120-T246187-N" -> "TA120-T246187"
+DEVICE_ID_FIELDS = compile_fields({"sensors.0.sensor": "string"})
 
 
 class RequestHandler(AsyncRequestHandler):
     async def validate(
-        self, request_data: dict, endpoint_data: dict
+        self, request_data: RequestView, endpoint_data: EndpointConfig
     ) -> Tuple[bool, Union[str, None], Union[int, None]]:
         """
         Use Starlette request_data here to determine should we accept or reject
         this request
-        :param request_data: deserialized (FastAPI) Starlette Request
+        :param request_data: view of (FastAPI) Starlette Request
         :param endpoint_data: endpoint data from device registry
         :return: (bool ok, str error text, int status code)
         """
@@ -24,20 +28,18 @@ class RequestHandler(AsyncRequestHandler):
         if status_ok is False:
             return False, response_message, status_code
 
-        try:
-            # check if device id can be extracted
-            json.loads(request_data["request"]["body"].decode("utf-8"))["sensors"][0][
-                "sensor"
-            ][0:-2]
-            return True, "Request accepted", 202
-        except Exception:
-            logging.warning("unable to retreive device_id from request body")
+        # check if device id can be extracted
+        error = check_payload(request_data, DEVICE_ID_FIELDS)
+        if error:
+            count_rejection(error)
+            logging.warning(f"unable to retreive device_id from request body: {error}")
             return False, "Invalid request, see logs for error", 400
+        return True, "Request accepted", 202
 
     async def process_request(
         self,
-        request_data: dict,
-        endpoint_data: dict,
+        request_data: RequestView,
+        endpoint_data: EndpointConfig,
     ) -> Tuple[bool, str, Union[str, None], Union[str, dict, list], int]:
         auth_ok, response_message, status_code = await self.validate(
             request_data, endpoint_data
@@ -47,16 +49,15 @@ class RequestHandler(AsyncRequestHandler):
             "Validation: {}, {}, {}".format(auth_ok, response_message, status_code)
         )
         if auth_ok:
-            device_id = json.loads(request_data["request"]["body"].decode("utf-8"))[
-                "sensors"
-            ][0]["sensor"][0:-2]
-            topic_name = endpoint_data["kafka_raw_data_topic"]
+            # payload was parsed and checked in validate()
+            device_id = request_data.json["sensors"][0]["sensor"][0:-2]
+            topic_name = endpoint_data.kafka_raw_data_topic
         else:
             device_id = None
             topic_name = None
         return auth_ok, device_id, topic_name, response_message, status_code
 
-    async def get_metadata(self, request_data: dict, device_id: str) -> str:
+    async def get_metadata(self, request_data: RequestView, device_id: str) -> str:
         # TODO: put this function to BaseRequestHandler or remove from endpoint
         # (and add to parser)
         metadata = "{}"
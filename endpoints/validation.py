@@ -0,0 +1,290 @@
+import logging
+import re
+from collections import Counter
+from typing import Callable, Optional, Tuple, Union
+
+from .models import EndpointConfig, RequestView
+
+# Rejected payloads counted by error type, e.g. {"invalid_json": 3, "required": 1}
+rejections: Counter = Counter()
+
+# A compiled check returns None when the value is valid, otherwise the error type
+Check = Callable[[object], Optional[str]]
+
+INVALID_JSON = "invalid_json"
+# Endpoint has validation rules, but they could not be compiled
+INVALID_CONFIG = "invalid_config"
+
+JSON_TYPES = {
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "null": lambda v: v is None,
+}
+
+SCHEMA_KEYWORDS = frozenset(
+    [
+        "type",
+        "enum",
+        "required",
+        "properties",
+        "additionalProperties",
+        "items",
+        "minItems",
+        "maxItems",
+        "minLength",
+        "maxLength",
+        "pattern",
+        "minimum",
+        "maximum",
+    ]
+)
+# Keywords which don't affect validation
+ANNOTATION_KEYWORDS = frozenset(["$schema", "$id", "$comment", "title", "description", "default", "examples"])
+
+
+def _is_number(value) -> bool:
+    return JSON_TYPES["number"](value)
+
+
+def _is_count(value) -> bool:
+    return JSON_TYPES["integer"](value) and value >= 0
+
+
+def _check_rule(schema: dict, keyword: str, test: Callable[[object], bool], expected: str):
+    if keyword in schema and not test(schema[keyword]):
+        raise ValueError(f"'{keyword}' must be {expected}, got {schema[keyword]!r}")
+
+
+def _compile_type(type_name: Union[str, list]) -> Check:
+    if not isinstance(type_name, (str, list)):
+        raise ValueError(f"Type must be a type name or a list of them, got {type_name!r}")
+    names = [type_name] if isinstance(type_name, str) else type_name
+    for name in names:
+        if name not in JSON_TYPES:
+            raise ValueError(f"Unknown type '{name}' in payload schema")
+    tests = tuple(JSON_TYPES[name] for name in names)
+
+    def check(value):
+        for test in tests:
+            if test(value):
+                return None
+        return "type"
+
+    return check
+
+
+def compile_schema(schema: dict) -> Check:
+    """
+    Compile a JSON schema into a single check function.
+    Supported keywords: type, enum, required, properties, additionalProperties (boolean), items (schema),
+    minItems, maxItems, minLength, maxLength, pattern, minimum and maximum.
+    Annotations ($schema, title, description etc.) are ignored.
+    :raise ValueError: on unsupported keywords and invalid keyword values, so that rules are never partially applied
+    """
+    if not isinstance(schema, dict):
+        raise ValueError(f"Schema must be an object, got {schema!r}")
+    unsupported = set(schema) - SCHEMA_KEYWORDS - ANNOTATION_KEYWORDS
+    if unsupported:
+        raise ValueError(f"Unsupported keywords in payload schema: {', '.join(sorted(unsupported))}")
+    _check_rule(schema, "enum", lambda v: isinstance(v, list), "a list")
+    _check_rule(
+        schema, "required", lambda v: isinstance(v, list) and all(isinstance(k, str) for k in v), "a list of strings"
+    )
+    _check_rule(schema, "properties", lambda v: isinstance(v, dict), "an object")
+    _check_rule(schema, "additionalProperties", lambda v: isinstance(v, bool), "a boolean")
+    _check_rule(schema, "pattern", lambda v: isinstance(v, str), "a string")
+    for keyword in ("minimum", "maximum"):
+        _check_rule(schema, keyword, _is_number, "a number")
+    for keyword in ("minLength", "maxLength", "minItems", "maxItems"):
+        _check_rule(schema, keyword, _is_count, "a non-negative integer")
+    checks = []
+    if "type" in schema:
+        checks.append(_compile_type(schema["type"]))
+    if "enum" in schema:
+        enum = schema["enum"]
+        checks.append(lambda v: None if v in enum else "enum")
+    if "minLength" in schema or "maxLength" in schema or "pattern" in schema:
+        min_length = schema.get("minLength", 0)
+        max_length = schema.get("maxLength")
+        pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+
+        def check_string(value):
+            if not isinstance(value, str):
+                return None
+            if len(value) < min_length or (max_length is not None and len(value) > max_length):
+                return "length"
+            if pattern is not None and pattern.search(value) is None:
+                return "pattern"
+            return None
+
+        checks.append(check_string)
+    if "minimum" in schema or "maximum" in schema:
+        minimum = schema.get("minimum")
+        maximum = schema.get("maximum")
+
+        def check_range(value):
+            if not JSON_TYPES["number"](value):
+                return None
+            if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                return "range"
+            return None
+
+        checks.append(check_range)
+    if "required" in schema or "properties" in schema or schema.get("additionalProperties") is False:
+        required = tuple(schema.get("required", ()))
+        properties = {key: compile_schema(sub) for key, sub in schema.get("properties", {}).items()}
+        additional = schema.get("additionalProperties", True) is not False
+
+        def check_object(value):
+            if not isinstance(value, dict):
+                return None
+            for key in required:
+                if key not in value:
+                    return "required"
+            for key, check in properties.items():
+                if key in value:
+                    error = check(value[key])
+                    if error:
+                        return error
+            if not additional:
+                for key in value:
+                    if key not in properties:
+                        return "additional_properties"
+            return None
+
+        checks.append(check_object)
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        items = compile_schema(schema["items"]) if "items" in schema else None
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems")
+
+        def check_array(value):
+            if not isinstance(value, list):
+                return None
+            if len(value) < min_items or (max_items is not None and len(value) > max_items):
+                return "items"
+            if items is not None:
+                for item in value:
+                    error = items(item)
+                    if error:
+                        return error
+            return None
+
+        checks.append(check_array)
+    checks = tuple(checks)
+
+    def check(value):
+        for c in checks:
+            error = c(value)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+def compile_fields(fields: dict) -> Check:
+    """
+    Compile a declarative field spec into a check function.
+    Keys are dotted paths into the JSON payload (list indexes as numbers), values are JSON type names, e.g.
+    {"sensors.0.sensor": "string"}
+    """
+    if not isinstance(fields, dict):
+        raise ValueError(f"Payload fields must be an object, got {fields!r}")
+    compiled = []
+    for path, type_name in fields.items():
+        keys = tuple(int(k) if k.isdigit() else k for k in path.split("."))
+        compiled.append((keys, _compile_type(type_name)))
+    compiled = tuple(compiled)
+
+    def check(value):
+        for keys, check_type in compiled:
+            current = value
+            for key in keys:
+                if isinstance(key, int):
+                    if not isinstance(current, list) or key >= len(current):
+                        return "required"
+                elif not isinstance(current, dict) or key not in current:
+                    return "required"
+                current = current[key]
+            error = check_type(current)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+def compile_payload_validator(properties: Union[dict, None]) -> Union[Check, None]:
+    """
+    Compile endpoint's payload validation rules from Device registry endpoint properties.
+    Properties may contain "payload_schema" (JSON schema) and/or "payload_fields" (declarative field spec).
+    :return: check function for parsed JSON payload or None, if endpoint has no validation rules
+    :raise ValueError: if validation rules are invalid
+    """
+    if not isinstance(properties, dict):
+        return None
+    checks = []
+    try:
+        if properties.get("payload_schema"):
+            checks.append(compile_schema(properties["payload_schema"]))
+        if properties.get("payload_fields"):
+            checks.append(compile_fields(properties["payload_fields"]))
+    except (AttributeError, KeyError, TypeError, ValueError, re.error) as e:
+        raise ValueError(f"Invalid payload validation rules: {e}") from e
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+
+    def check(payload):
+        for c in checks:
+            error = c(payload)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+def reject_invalid_config(_payload) -> str:
+    """Validator for endpoints whose validation rules are broken: reject everything instead of accepting."""
+    return INVALID_CONFIG
+
+
+def check_payload(request_data: RequestView, check: Check) -> Optional[str]:
+    """
+    Run a compiled check against request's JSON payload, which is parsed only once per request.
+    :return: None if payload is valid, otherwise the error type
+    """
+    try:
+        payload = request_data.json
+    except ValueError:
+        return INVALID_JSON
+    return check(payload)
+
+
+def count_rejection(error: str):
+    """Count a rejected payload by error type, shown in /stats payload_rejections."""
+    rejections[error] += 1
+
+
+def validate_payload(request_data: RequestView, endpoint_data: EndpointConfig) -> Tuple[bool, Union[str, None]]:
+    """
+    Run endpoint's compiled payload validator (if any) against request body and count rejections.
+    :return: (bool ok, str error type)
+    """
+    validator = endpoint_data.payload_validator
+    if validator is None:
+        return True, None
+    error = check_payload(request_data, validator)
+    if error:
+        count_rejection(error)
+        logging.warning(f"Payload rejected by {endpoint_data.endpoint_path} validator: {error}")
+        return False, error
+    return True, None
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+httpx = pytest.importorskip("httpx")
+
+from endpoint import replay as replay_module  # noqa: E402
+from endpoint.capture import TrafficCapture, get_record_body, read_capture  # noqa: E402
+from endpoint.replay import replay  # noqa: E402
+
+
+class QueryParams:
+    def __init__(self, items: list):
+        self.items = items
+
+    def multi_items(self) -> list:
+        return self.items
+
+
+class FakeRequest:
+    """Starlette Request stand-in with the attributes used by TrafficCapture."""
+
+    def __init__(self, body: bytes, headers: dict = None, query: list = None, method: str = "POST"):
+        self.method = method
+        self.headers = headers or {}
+        self.query_params = QueryParams(query or [])
+        self._body = body
+
+    async def body(self) -> bytes:
+        return self._body
+
+
+def capture_requests(filename: str, requests: list, **kwargs):
+    capture = TrafficCapture(filename, **kwargs)
+    try:
+        for request in requests:
+            asyncio.run(capture.sample(request, "/api/v1/data"))
+    finally:
+        capture.close()
+
+
+def test_capture_writes_ndjson(tmp_path):
+    filename = str(tmp_path / "capture.ndjson")
+    capture_requests(
+        filename,
+        [
+            FakeRequest(b'{"a": 1}', {"x-api-key": "abc123"}, [("LrnDevEui", "70B3"), ("LrnDevEui", "70B4")]),
+            FakeRequest(b"\xff\xfe\x00", method="PUT"),
+        ],
+    )
+    with open(filename) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 2
+    assert set(lines[0]) == {"ts", "method", "path", "headers", "query", "body"}
+    assert lines[0]["method"] == "POST"
+    assert lines[0]["path"] == "/api/v1/data"
+    assert lines[0]["headers"] == {"x-api-key": "abc123"}
+    assert lines[0]["query"] == [["LrnDevEui", "70B3"], ["LrnDevEui", "70B4"]]
+    assert lines[0]["body"] == '{"a": 1}'
+    # Non UTF-8 body is base64 encoded
+    assert "body" not in lines[1]
+    assert lines[1]["body_b64"] == "//4A"
+
+
+def test_capture_round_trip(tmp_path):
+    filename = str(tmp_path / "capture.ndjson")
+    bodies = [b'{"a": 1}', b"\xff\xfe\x00", b""]
+    capture_requests(filename, [FakeRequest(body) for body in bodies])
+    records = read_capture(filename)
+    assert [get_record_body(record) for record in records] == bodies
+    assert [record["ts"] for record in records] == sorted(record["ts"] for record in records)
+
+
+def test_capture_sample_rate(tmp_path):
+    filename = str(tmp_path / "capture.ndjson")
+    capture_requests(filename, [FakeRequest(b"{}") for _ in range(10)], sample_rate=0.0)
+    assert read_capture(filename) == []
+
+
+def make_records(count: int, interval: float) -> list:
+    return [
+        {
+            "ts": 1000.0 + i * interval,
+            "method": "POST",
+            "path": "/api/v1/data",
+            "headers": {"Host": "prod.example.com", "Content-Length": "999", "x-api-key": "abc123"},
+            "query": [["n", str(i)]],
+            # Every other body is binary
+            **({"body": '{"a": 1}'} if i % 2 == 0 else {"body_b64": "//4A"}),
+        }
+        for i in range(count)
+    ]
+
+
+class Server:
+    """Mock endpoint instance, which records received requests."""
+
+    def __init__(self):
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.params["n"] == "3":
+            return httpx.Response(400)
+        return httpx.Response(202)
+
+
+def test_replay_counts_and_headers():
+    server = Server()
+    records = make_records(4, 0.0)
+    result = asyncio.run(replay(records, "http://replay.test", 0, 2, transport=httpx.MockTransport(server.handler)))
+    assert result["statuses"] == {202: 3, 400: 1}
+    assert len(result["latencies"]) == 4
+    request = server.requests[0]
+    # Host and Content-Length are set by the client, not copied from the capture
+    assert request.headers["host"] == "replay.test"
+    assert request.headers["content-length"] == str(len(b'{"a": 1}'))
+    assert request.headers["x-api-key"] == "abc123"
+    assert request.content == b'{"a": 1}'
+    assert server.requests[1].content == b"\xff\xfe\x00"
+
+
+def test_replay_timing():
+    transport = httpx.MockTransport(Server().handler)
+    records = make_records(3, 10.0)
+    # Speed 0 ignores the original 20 s spread
+    started = time.monotonic()
+    asyncio.run(replay(records, "http://replay.test", 0, 10, transport=transport))
+    assert time.monotonic() - started < 1.0
+    # Speed 100 replays it in about 0.2 s
+    started = time.monotonic()
+    asyncio.run(replay(records, "http://replay.test", 100, 10, transport=transport))
+    assert time.monotonic() - started >= 0.15
+
+
+def test_replay_without_records():
+    assert asyncio.run(replay([], "http://replay.test", 1, 1)) == {"statuses": {}, "latencies": []}
+
+
+@pytest.mark.parametrize("args", [["--concurrency", "0"], ["--concurrency", "-1"], ["--speed", "-1"]])
+def test_replay_rejects_invalid_arguments(monkeypatch, capsys, args):
+    monkeypatch.setattr(sys, "argv", ["replay", "capture.ndjson"] + args)
+    with pytest.raises(SystemExit) as exc_info:
+        replay_module.main()
+    assert exc_info.value.code == 2
+    assert args[0] in capsys.readouterr().err
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from endpoint.delivery import DeliveryTracker
+
+
+def test_pending_delivered_and_failed():
+    tracker = DeliveryTracker(10)
+    delivered = tracker.add("/api/v1/data", "test.rawdata")
+    failed = tracker.add("/api/v1/data", "test.rawdata")
+    assert delivered != failed
+    assert tracker.get(delivered)["status"] == "pending"
+    tracker.delivered(delivered, SimpleNamespace(partition=1, offset=42))
+    tracker.failed(failed, Exception("broker down"))
+    assert tracker.get(delivered)["status"] == "delivered"
+    assert (tracker.get(delivered)["partition"], tracker.get(delivered)["offset"]) == (1, 42)
+    assert tracker.get(failed)["status"] == "failed"
+    assert tracker.get(failed)["error"] == "broker down"
+    assert tracker.get("unknown") is None
+
+
+def test_oldest_deliveries_are_evicted():
+    tracker = DeliveryTracker(3)
+    request_ids = [tracker.add("/api/v1/data", "test.rawdata") for _ in range(5)]
+    assert len(tracker.deliveries) == 3
+    assert tracker.get(request_ids[0]) is None
+    assert tracker.get(request_ids[1]) is None
+    assert all(tracker.get(request_id) for request_id in request_ids[2:])
+    # Results of evicted deliveries are ignored
+    tracker.delivered(request_ids[0], SimpleNamespace(partition=0, offset=1))
+    assert len(tracker.deliveries) == 3
+
+
+def test_status_route():
+    pytest.importorskip("fvhiot")
+    testclient = pytest.importorskip("fastapi.testclient")
+    from endpoint import endpoint
+
+    client = testclient.TestClient(endpoint.app)
+    request_id = endpoint.app_delivery_tracker.add("/api/v1/data", "test.rawdata")
+    response = client.get(f"/status/{request_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+    endpoint.app_delivery_tracker.delivered(request_id, SimpleNamespace(partition=0, offset=7))
+    response = client.get(f"/status/{request_id}")
+    assert response.json()["status"] == "delivered"
+    assert response.json()["offset"] == 7
+    response = client.get("/status/unknown")
+    assert response.status_code == 404
+    assert response.json()["status"] == "unknown"
@@ -0,0 +1,128 @@
+import asyncio
+import sys
+import textwrap
+
+import pytest
+
+from endpoint.handlers import HandlerLoader
+from endpoints.models import EndpointConfig
+
+HANDLER_SOURCE = """
+from endpoints import AsyncRequestHandler
+
+from . import events
+
+VERSION = {version!r}
+events.append(("import", VERSION))
+
+
+class RequestHandler(AsyncRequestHandler):
+    async def validate(self, request_data, endpoint_data):
+        return True, "OK", 200
+
+    async def process_request(self, request_data, endpoint_data):
+        return True, None, None, VERSION, 200
+
+    async def get_metadata(self, request_data, device_id):
+        return "{{}}"
+
+    async def close(self):
+        # Module globals of the version this instance was created from
+        events.append(("close", VERSION))
+"""
+
+
+@pytest.fixture
+def handler_package(tmp_path, monkeypatch):
+    """Scratch handler package, whose handler module can be rewritten to simulate a deployment."""
+    package = tmp_path / "scratchhandlers"
+    package.mkdir()
+    (package / "__init__.py").write_text("events = []\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # Rewrites within the same second must not be served from stale bytecode
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+
+    def deploy(version: str):
+        (package / "handler.py").write_text(textwrap.dedent(HANDLER_SOURCE.format(version=version)))
+
+    yield deploy
+    for name in list(sys.modules):
+        if name.startswith("scratchhandlers"):
+            del sys.modules[name]
+
+
+def make_endpoint(path: str, handler: str) -> EndpointConfig:
+    return EndpointConfig({"endpoint_path": path, "http_request_handler": handler})
+
+
+def test_versions_coexist(handler_package):
+    import scratchhandlers
+
+    async def main():
+        loader = HandlerLoader(drain_timeout=1)
+        handler_package("1")
+        a = make_endpoint("/a", "scratchhandlers.handler@1")
+        a.request_handler = await loader.get_handler(a)
+        handler_package("2")
+        b = make_endpoint("/b", "scratchhandlers.handler@2")
+        b.request_handler = await loader.get_handler(b)
+        # Version 1 is not re-executed by loading version 2
+        assert (await a.request_handler.process_request(None, a))[3] == "1"
+        assert (await b.request_handler.process_request(None, b))[3] == "2"
+        # Another endpoint with an already loaded version reuses the module
+        c = make_endpoint("/c", "scratchhandlers.handler@1")
+        c.request_handler = await loader.get_handler(c)
+        assert c.request_handler.__class__ is a.request_handler.__class__
+        assert scratchhandlers.events == [("import", "1"), ("import", "2")]
+        # Version 1 is retired, it is closed with its own globals and its module is dropped
+        loader.retire_unused({"/b": b})
+        await asyncio.gather(*loader.drain_tasks)
+        assert sorted(scratchhandlers.events[2:]) == [("close", "1"), ("close", "1")]
+        assert "scratchhandlers.handler@1" not in sys.modules
+        assert "scratchhandlers.handler@2" in sys.modules
+        assert list(loader.modules) == [("scratchhandlers.handler", "2")]
+
+    asyncio.run(main())
+
+
+def test_failed_load_keeps_previous_handler(handler_package):
+    async def main():
+        loader = HandlerLoader()
+        handler_package("1")
+        endpoint = make_endpoint("/a", "scratchhandlers.handler@1")
+        previous = await loader.get_handler(endpoint)
+        assert await loader.get_handler(make_endpoint("/a", "scratchhandlers.missing@2")) is previous
+        assert await loader.get_handler(make_endpoint("/b", "scratchhandlers.missing@2")) is None
+        assert "scratchhandlers.missing@2" not in sys.modules
+
+    asyncio.run(main())
+
+
+def test_in_flight_counter_never_goes_negative():
+    loader = HandlerLoader()
+    handler = object()
+    loader.acquire(handler)
+    loader.acquire(handler)
+    loader.release(handler)
+    assert loader.in_flight[handler] == 1
+    loader.release(handler)
+    assert handler not in loader.in_flight
+
+
+def test_drain_waits_for_in_flight_requests(handler_package):
+    import scratchhandlers
+
+    async def main():
+        loader = HandlerLoader(drain_timeout=5)
+        handler_package("1")
+        handler = await loader.get_handler(make_endpoint("/a", "scratchhandlers.handler@1"))
+        loader.acquire(handler)
+        loader.retire_unused({})
+        await asyncio.sleep(0.2)
+        assert ("close", "1") not in scratchhandlers.events
+        loader.release(handler)
+        await asyncio.gather(*loader.drain_tasks)
+        assert scratchhandlers.events[-1] == ("close", "1")
+        assert handler not in loader.in_flight
+
+    asyncio.run(main())
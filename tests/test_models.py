@@ -0,0 +1,160 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from endpoints.models import EndpointConfig, RequestView
+
+ENDPOINT_DATA = {
+    "id": 2,
+    "created_at": "2023-10-01T15:00:00.042000+03:00",
+    "updated_at": "2023-10-01T15:00:00.042000+03:00",
+    "endpoint_path": "/api/v1/digita",
+    "http_request_handler": "endpoints.digita.aiothingpark@2024-05-01",
+    "auth_token": "abc123",
+    "data_source": "digita.thingpark.http",
+    "properties": {"async_ack": True},
+    "allowed_ip_addresses": None,
+    "kafka_raw_data_topic": "digita.rawdata",
+    "kafka_parsed_data_topic": "digita.parsed",
+    "kafka_group_id": "digita_dev",
+    "host": 1,
+}
+
+
+class FakeRequest:
+    """Starlette Request stand-in, which counts header and query parameter access."""
+
+    method = "POST"
+    client = SimpleNamespace(host="127.0.0.1")
+
+    def __init__(self):
+        self.header_reads = 0
+        self.query_reads = 0
+        self.url = SimpleNamespace(path="/api/v1/digita")
+
+    @property
+    def headers(self):
+        self.header_reads += 1
+        return {"x-api-key": "abc123", "content-type": "application/json"}
+
+    @property
+    def query_params(self):
+        self.query_reads += 1
+        return {"LrnDevEui": "70B3D57050011422"}
+
+
+def test_endpoint_config_fields():
+    endpoint = EndpointConfig(ENDPOINT_DATA)
+    assert endpoint.endpoint_path == "/api/v1/digita"
+    assert endpoint.http_request_handler == "endpoints.digita.aiothingpark"
+    assert endpoint.http_request_handler_version == "2024-05-01"
+    assert endpoint.allowed_ip_addresses == ""
+    assert endpoint.async_ack is True
+    assert endpoint.request_handler is None
+    assert not hasattr(endpoint, "__dict__")
+
+
+def test_endpoint_config_without_version():
+    endpoint = EndpointConfig({"endpoint_path": "/a", "http_request_handler": "endpoints.sentilo.cesva"})
+    assert endpoint.http_request_handler == "endpoints.sentilo.cesva"
+    assert endpoint.http_request_handler_version is None
+    assert endpoint.async_ack is False
+    assert endpoint.extra == {}
+
+
+def test_endpoint_config_dict_access():
+    endpoint = EndpointConfig(ENDPOINT_DATA)
+    assert endpoint["auth_token"] == "abc123"
+    assert endpoint["kafka_raw_data_topic"] == "digita.rawdata"
+    # Unknown registry keys are kept
+    assert endpoint["created_at"] == ENDPOINT_DATA["created_at"]
+    assert endpoint.get("updated_at") == ENDPOINT_DATA["updated_at"]
+    assert endpoint.extra == {"created_at": ENDPOINT_DATA["created_at"], "updated_at": ENDPOINT_DATA["updated_at"]}
+    assert endpoint.get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        endpoint["missing"]
+    # Methods are not exposed as keys
+    with pytest.raises(KeyError):
+        endpoint["get"]
+
+
+def test_request_view_reads_headers_and_query_lazily():
+    request = FakeRequest()
+    view = RequestView(request, "/api/v1/digita", b"{}")
+    assert (request.header_reads, request.query_reads) == (0, 0)
+    assert view.query.get("LrnDevEui") == "70B3D57050011422"
+    assert view.query.get("x-api-key") is None
+    assert view.headers.get("x-api-key") == "abc123"
+    assert view.headers.get("content-type") == "application/json"
+    assert (request.header_reads, request.query_reads) == (1, 1)
+
+
+def test_request_view_dict_access():
+    view = RequestView(FakeRequest(), "/api/v1/digita", b"body")
+    assert view["path"] == "/api/v1/digita"
+    assert view["remote_addr"] == "127.0.0.1"
+    assert view["request"]["get"]["LrnDevEui"] == "70B3D57050011422"
+    assert view["request"]["headers"]["x-api-key"] == "abc123"
+    assert view["request"]["body"] == b"body"
+    assert view["request"].get("extra") is None
+    assert view.get("extra") is None
+    with pytest.raises(KeyError):
+        view["missing"]
+
+
+def test_request_view_json_is_parsed_once():
+    view = RequestView(FakeRequest(), "/api/v1/digita", b'{"a": [1]}')
+    payload = view.json
+    assert payload == {"a": [1]}
+    assert view.json is payload
+    invalid = RequestView(FakeRequest(), "/api/v1/digita", b"{")
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            _ = invalid.json
+
+
+def test_request_view_to_dict():
+    view = RequestView(FakeRequest(), "/api/v1/digita", b"{}")
+    data = view.to_dict("70B3D57050011422")
+    assert data["device_id"] == "70B3D57050011422"
+    assert view.to_dict()["device_id"] is None
+    assert data["path"] == "/api/v1/digita"
+    assert data["remote_addr"] == "127.0.0.1"
+    assert data["time"]
+    assert data["request"]["method"] == "POST"
+    assert data["request"]["headers"] == {"x-api-key": "abc123", "content-type": "application/json"}
+    assert data["request"]["get"] == {"LrnDevEui": "70B3D57050011422"}
+    assert data["request"]["body"] == b"{}"
+
+
+def test_kafka_message_shape():
+    """Raw data messages are consumed by parsers, their shape must not change by accident."""
+    starlette_requests = pytest.importorskip("starlette.requests")
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "scheme": "https",
+        "server": ("endpoint.example.com", 443),
+        "client": ("10.0.0.1", 12345),
+        "root_path": "",
+        "path": "/api/v1/digita",
+        "query_string": b"LrnDevEui=70B3D57050011422&LrnFPort=1",
+        "headers": [(b"host", b"endpoint.example.com"), (b"x-api-key", b"abc123")],
+    }
+    view = RequestView(starlette_requests.Request(scope), "/api/v1/digita", b'{"a": 1}')
+    data = view.to_dict("70B3D57050011422")
+    assert set(data) == {"path", "remote_addr", "time", "request", "device_id"}
+    assert set(data["request"]) == {"method", "url", "headers", "get", "body"}
+    assert data["path"] == "/api/v1/digita"
+    assert data["remote_addr"] == "10.0.0.1"
+    assert isinstance(data["time"], str)
+    assert datetime.fromisoformat(data["time"]).tzinfo is not None
+    assert data["request"]["method"] == "POST"
+    assert data["request"]["url"] == "https://endpoint.example.com/api/v1/digita?LrnDevEui=70B3D57050011422&LrnFPort=1"
+    assert data["request"]["headers"].__class__ is dict
+    assert data["request"]["headers"] == {"host": "endpoint.example.com", "x-api-key": "abc123"}
+    assert data["request"]["get"].__class__ is dict
+    assert data["request"]["get"] == {"LrnDevEui": "70B3D57050011422", "LrnFPort": "1"}
+    assert data["request"]["body"] == b'{"a": 1}'
+    assert data["device_id"] == "70B3D57050011422"
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiokafka")
+pytest.importorskip("fvhiot")
+
+from endpoint import producer as producer_module  # noqa: E402
+from endpoint.producer import ProducerManager  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self):
+        self.healthy = True
+
+    async def fetch_all_metadata(self):
+        if not self.healthy:
+            raise ConnectionError("broker down")
+
+
+class FakeProducer:
+    def __init__(self):
+        self.client = FakeClient()
+        self.stopped = False
+
+    async def stop(self):
+        self.stopped = True
+
+
+class FakeFactory:
+    """Replacement for get_aiokafka_producer_by_envs, fails as many times as told."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.producers = []
+
+    async def __call__(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("no brokers")
+        self.producers.append(FakeProducer())
+        return self.producers[-1]
+
+
+def make_manager(monkeypatch, factory: FakeFactory) -> ProducerManager:
+    monkeypatch.setattr(producer_module, "get_aiokafka_producer_by_envs", factory)
+    return ProducerManager(health_interval=0.01, health_timeout=0.1, max_failures=3, max_backoff=0.01)
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition was not met in time"
+        await asyncio.sleep(0.005)
+
+
+def test_retries_creation_in_background(monkeypatch):
+    factory = FakeFactory(failures=2)
+    manager = make_manager(monkeypatch, factory)
+
+    async def main():
+        await manager.start()
+        assert not manager.ready
+        assert manager.producer is None
+        await wait_for(lambda: manager.ready)
+        assert manager.status()["state"] == "connected"
+        await manager.stop()
+
+    asyncio.run(main())
+    assert len(factory.producers) == 1
+    assert factory.producers[0].stopped
+
+
+def test_stays_ready_until_max_failures_and_replaces_producer(monkeypatch):
+    factory = FakeFactory()
+    manager = make_manager(monkeypatch, factory)
+
+    async def main():
+        await manager.start()
+        first = manager.producer
+        first.client.healthy = False
+        await wait_for(lambda: manager.failures == 1)
+        # One failed check doesn't take the pod out of rotation
+        assert manager.ready
+        await wait_for(lambda: manager.producer is not first)
+        assert manager.ready
+        await wait_for(lambda: first.stopped)
+        await manager.stop()
+
+    asyncio.run(main())
+    assert len(factory.producers) == 2
+
+
+def test_keeps_old_producer_when_replacement_fails(monkeypatch):
+    factory = FakeFactory()
+    manager = make_manager(monkeypatch, factory)
+
+    async def main():
+        await manager.start()
+        first = manager.producer
+        factory.failures = 1000
+        first.client.healthy = False
+        await wait_for(lambda: manager.failures >= manager.max_failures)
+        assert manager.producer is first
+        assert not first.stopped
+        assert not manager.ready
+        # Broker comes back, old producer is healthy again
+        first.client.healthy = True
+        await wait_for(lambda: manager.ready)
+        assert manager.producer is first
+        await manager.stop()
+
+    asyncio.run(main())
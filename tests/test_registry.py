@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from endpoint.registry import DeviceRegistryClient, RegistryUnavailable  # noqa: E402
+
+URL = "http://registry.test/api/v1/hosts/localhost/"
+CONFIG = {"slug": "localhost", "endpoints": [{"endpoint_path": "/api/v1/data"}]}
+
+
+class Registry:
+    """
+    Mock Device registry, which responds with given status codes in order and then with the last one.
+    A status may also be a (status, JSON body) tuple.
+    """
+
+    def __init__(self, *statuses, delay: float = 0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if isinstance(status, tuple):
+            return httpx.Response(status[0], json=status[1])
+        if status == 200:
+            return httpx.Response(200, json=CONFIG)
+        return httpx.Response(status, text="error")
+
+    def client(self, **kwargs) -> DeviceRegistryClient:
+        kwargs.setdefault("backoff", 0.0)
+        return DeviceRegistryClient(URL, {}, transport=httpx.MockTransport(self.handler), **kwargs)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_retries_until_success():
+    registry = Registry(503, 503, 200)
+
+    async def main():
+        client = registry.client(retries=3)
+        try:
+            return await client.get_config()
+        finally:
+            await client.close()
+
+    assert run(main()) == CONFIG
+    assert registry.calls == 3
+
+
+def test_client_error_is_not_retried():
+    registry = Registry(404)
+
+    async def main():
+        client = registry.client(retries=3)
+        try:
+            with pytest.raises(RegistryUnavailable):
+                await client.get_config()
+        finally:
+            await client.close()
+
+    run(main())
+    assert registry.calls == 1
+
+
+def test_falls_back_to_last_good_config():
+    registry = Registry(200, 500)
+
+    async def main():
+        client = registry.client(retries=1)
+        try:
+            assert await client.get_config() == CONFIG
+            assert await client.get_config() == CONFIG
+        finally:
+            await client.close()
+
+    run(main())
+    assert registry.calls == 3
+
+
+def test_circuit_opens_and_half_opens():
+    registry = Registry(500)
+
+    async def main():
+        client = registry.client(retries=0, failure_threshold=2, reset_timeout=60)
+        try:
+            for _ in range(2):
+                with pytest.raises(RegistryUnavailable):
+                    await client.get_config()
+            assert client.circuit_open
+            # Circuit is open, registry is not called
+            with pytest.raises(RegistryUnavailable):
+                await client.get_config()
+            assert registry.calls == 2
+            # After reset timeout one request is let through
+            client.reset_timeout = 0
+            registry.statuses = [200]
+            assert await client.get_config() == CONFIG
+            assert registry.calls == 3
+            assert not client.circuit_open
+            assert client.failures == 0
+        finally:
+            await client.close()
+
+    run(main())
+
+
+def test_cache_file_survives_restart(tmp_path):
+    cache_file = str(tmp_path / "registry.json")
+
+    async def main():
+        client = Registry(200).client(cache_file=cache_file)
+        try:
+            await client.get_config()
+        finally:
+            await client.close()
+        # "Restarted" client with the registry down uses the cached config
+        client = Registry(503).client(retries=0, cache_file=cache_file)
+        try:
+            return await client.get_config()
+        finally:
+            await client.close()
+
+    assert run(main()) == CONFIG
+
+
+def test_concurrent_callers_share_one_fetch():
+    registry = Registry(200, delay=0.05)
+
+    async def main():
+        client = registry.client()
+        try:
+            results = await asyncio.gather(*(client.get_config() for _ in range(10)))
+            assert all(result == CONFIG for result in results)
+            assert registry.calls == 1
+            # Next call after the fetch has completed makes a new request
+            await client.get_config()
+            assert registry.calls == 2
+        finally:
+            await client.close()
+
+    run(main())
+
+
+def test_concurrent_callers_share_failure():
+    registry = Registry(500, delay=0.01)
+
+    async def main():
+        client = registry.client(retries=1)
+        try:
+            results = await asyncio.gather(*(client.get_config() for _ in range(5)), return_exceptions=True)
+            assert all(isinstance(result, RegistryUnavailable) for result in results)
+        finally:
+            await client.close()
+
+    run(main())
+    assert registry.calls == 2
+
+
+def test_response_without_endpoints_is_a_failure(tmp_path):
+    cache_file = str(tmp_path / "registry.json")
+    registry = Registry(200, (200, {"detail": "maintenance"}), (200, {"endpoints": None}), (200, []))
+
+    async def main():
+        client = registry.client(retries=2, cache_file=cache_file)
+        try:
+            assert await client.get_config() == CONFIG
+            # Bad responses are retried, counted as failures and the last good config is kept
+            assert await client.get_config() == CONFIG
+            assert client.failures == 1
+            assert client.last_good == CONFIG
+        finally:
+            await client.close()
+        # Cache file still has the good config
+        client = Registry(503).client(retries=0, cache_file=cache_file)
+        try:
+            return await client.get_config()
+        finally:
+            await client.close()
+
+    assert run(main()) == CONFIG
+    assert registry.calls == 4
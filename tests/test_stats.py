@@ -0,0 +1,152 @@
+import pytest
+
+from endpoint import stats
+from endpoint.stats import EndpointStats, LatencyHistogram, SpaceSaving
+
+
+class Clock:
+    """Replacement for the time module used by endpoint.stats."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(stats, "time", clock)
+    return clock
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) is None
+    for ms in range(1, 101):
+        histogram.add(ms / 1000)
+    for p, expected in ((0.5, 0.050), (0.95, 0.095), (0.99, 0.099)):
+        # Upper bound of the bucket, within the growth factor
+        assert expected <= histogram.percentile(p) <= expected * LatencyHistogram.GROWTH
+
+
+def test_histogram_extremes():
+    histogram = LatencyHistogram()
+    histogram.add(0.0)
+    assert histogram.percentile(1.0) == LatencyHistogram.MIN_VALUE
+    histogram.add(1e9)
+    assert histogram.counts[-1] == 1
+    # Values beyond the range are clamped to the last bucket, about 47 minutes
+    assert 2840 < histogram.percentile(1.0) < 2860
+    assert histogram.total == 2
+
+
+def test_histogram_merge():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    for _ in range(3):
+        a.add(0.001)
+    b.add(1.0)
+    a.merge(b)
+    assert a.total == 4
+    assert a.percentile(0.5) < 0.0011
+    assert a.percentile(1.0) >= 1.0
+
+
+def test_space_saving_keeps_heavy_hitters():
+    counter = SpaceSaving(3)
+    for key, count in (("a", 10), ("b", 5), ("c", 1)):
+        counter.add(key, count)
+    counter.add("d")
+    # "d" replaces the smallest key and inherits its count
+    assert counter.counts == {"a": 10, "b": 5, "d": 2}
+    counter.add("a")
+    assert counter.counts["a"] == 11
+    assert len(counter.counts) == 3
+
+
+def test_space_saving_merge():
+    a, b = SpaceSaving(2), SpaceSaving(2)
+    a.add("x", 5)
+    a.add("y", 1)
+    b.add("x", 2)
+    b.add("z", 3)
+    a.merge(b)
+    assert a.counts["x"] == 7
+    assert len(a.counts) == 2
+    assert "z" in a.counts
+
+
+def test_slot_rotation(clock):
+    endpoint_stats = EndpointStats(window=60, slot_count=6)
+    endpoint_stats.record_response(200, 10, 2)
+    endpoint_stats.record_handler(0.01, "device-1")
+    clock.now += 30
+    endpoint_stats.record_response(500, 10, 2)
+    snapshot = endpoint_stats.snapshot()
+    assert snapshot["requests"] == 2
+    assert snapshot["statuses"] == {"200": 1, "500": 1}
+    assert snapshot["error_rate_by_status"] == {"500": 0.5}
+    assert snapshot["bytes_in"] == 20
+    assert snapshot["top_devices"] == [{"device_id": "device-1", "requests": 1}]
+    # First slot falls out of the window
+    clock.now += 40
+    snapshot = endpoint_stats.snapshot()
+    assert snapshot["requests"] == 1
+    assert snapshot["top_devices"] == []
+    # Same slot index a full window later is reset, not added to
+    clock.now += 60
+    endpoint_stats.record_response(200, 1, 1)
+    assert endpoint_stats.snapshot()["statuses"] == {"200": 1}
+
+
+def test_empty_snapshot(clock):
+    snapshot = EndpointStats().snapshot()
+    assert snapshot["requests"] == 0
+    assert snapshot["handler_latency_ms"] == {"p50": None, "p95": None, "p99": None}
+
+
+@pytest.fixture
+def app_client(monkeypatch):
+    pytest.importorskip("fvhiot")
+    testclient = pytest.importorskip("fastapi.testclient")
+    from endpoint import endpoint
+
+    monkeypatch.setattr(endpoint, "ADMIN_TOKEN", "secret")
+    return endpoint, testclient.TestClient(endpoint.app, raise_server_exceptions=False)
+
+
+def test_stats_route_requires_admin_token(app_client, monkeypatch):
+    endpoint, client = app_client
+    assert client.get("/stats").status_code == 401
+    assert client.get("/stats", headers={"Authorization": "Token wrong"}).status_code == 401
+    assert client.get("/stats", headers={"Authorization": "Token secret"}).status_code == 200
+    monkeypatch.setattr(endpoint, "ADMIN_TOKEN", None)
+    assert client.get("/stats", headers={"Authorization": "Token secret"}).status_code == 403
+
+
+@pytest.mark.parametrize(
+    "top, status_code", [("5", 200), ("1000", 200), ("x", 400), ("-1", 400), ("1.5", 400), ("²", 400)]
+)
+def test_stats_route_validates_top(app_client, top, status_code):
+    _, client = app_client
+    response = client.get("/stats", params={"top": top}, headers={"Authorization": "Token secret"})
+    assert response.status_code == status_code
+
+
+def test_handler_exception_is_recorded_as_500(app_client, monkeypatch):
+    endpoint, client = app_client
+
+    class BrokenHandler:
+        async def process_request(self, request_data, endpoint_data):
+            raise RuntimeError("handler bug")
+
+    path = "/api/v1/broken"
+    config = endpoint.EndpointConfig({"endpoint_path": path, "http_request_handler": "broken.handler"})
+    config.request_handler = BrokenHandler()
+    monkeypatch.setitem(endpoint.app_endpoints, path, config)
+    assert client.post(path, content=b"{}").status_code == 500
+    snapshot = endpoint.app_stats.get(path).snapshot()
+    assert snapshot["statuses"] == {"500": 1}
+    assert snapshot["handler_latency_ms"]["p50"] is not None
+    assert config.request_handler not in endpoint.app_handler_loader.in_flight
@@ -0,0 +1,228 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from endpoints import validation
+from endpoints.models import EndpointConfig, RequestView
+from endpoints.sentilo.cesva import RequestHandler as CesvaRequestHandler
+from endpoints.validation import (
+    INVALID_CONFIG,
+    INVALID_JSON,
+    check_payload,
+    compile_fields,
+    compile_payload_validator,
+    compile_schema,
+    reject_invalid_config,
+    validate_payload,
+)
+
+
+def make_view(body: bytes, query: dict = None, headers: dict = None) -> RequestView:
+    request = SimpleNamespace(
+        method="PUT",
+        client=SimpleNamespace(host="127.0.0.1"),
+        headers=headers or {},
+        query_params=query or {},
+    )
+    return RequestView(request, "/api/v1/test", body)
+
+
+def make_endpoint(properties) -> EndpointConfig:
+    return EndpointConfig(
+        {
+            "endpoint_path": "/api/v1/test",
+            "http_request_handler": "endpoints.sentilo.cesva",
+            "auth_token": "abc123",
+            "kafka_raw_data_topic": "test.rawdata",
+            "properties": properties,
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "schema, valid, invalid, error",
+    [
+        ({"type": "string"}, "a", 1, "type"),
+        ({"type": ["string", "null"]}, None, 1, "type"),
+        ({"type": "integer"}, 1, 1.5, "type"),
+        ({"type": "number"}, 1.5, True, "type"),
+        ({"type": "boolean"}, False, 0, "type"),
+        ({"type": "array"}, [], {}, "type"),
+        ({"type": "object"}, {}, [], "type"),
+        ({"enum": ["a", 1]}, 1, "b", "enum"),
+        ({"minLength": 2}, "ab", "a", "length"),
+        ({"maxLength": 2}, "ab", "abc", "length"),
+        ({"pattern": "^TA120-"}, "TA120-T1", "XX-T1", "pattern"),
+        ({"minimum": 0}, 0, -1, "range"),
+        ({"maximum": 10}, 10, 11, "range"),
+        ({"required": ["a"]}, {"a": 1}, {"b": 1}, "required"),
+        ({"properties": {"a": {"type": "string"}}}, {"a": "x"}, {"a": 1}, "type"),
+        ({"properties": {"a": {}}, "additionalProperties": False}, {"a": 1}, {"a": 1, "b": 2}, "additional_properties"),
+        ({"minItems": 1}, [1], [], "items"),
+        ({"maxItems": 1}, [1], [1, 2], "items"),
+        ({"items": {"type": "integer"}}, [1, 2], [1, "2"], "type"),
+    ],
+)
+def test_schema_keywords(schema, valid, invalid, error):
+    check = compile_schema(schema)
+    assert check(valid) is None
+    assert check(invalid) == error
+
+
+@pytest.mark.parametrize(
+    "schema, value",
+    [
+        ({"minLength": 5, "pattern": "x"}, 1),
+        ({"minimum": 5}, "1"),
+        ({"required": ["a"]}, []),
+        ({"minItems": 5}, {}),
+    ],
+)
+def test_schema_keywords_ignore_other_types(schema, value):
+    # Without "type", keywords only apply to values of their own type, like in JSON schema
+    assert compile_schema(schema)(value) is None
+
+
+def test_nested_schema():
+    check = compile_schema(
+        {
+            "type": "object",
+            "required": ["sensors"],
+            "properties": {
+                "sensors": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {"type": "object", "required": ["sensor"], "properties": {"sensor": {"type": "string"}}},
+                }
+            },
+        }
+    )
+    assert check({"sensors": [{"sensor": "TA120-T246187-N"}]}) is None
+    assert check({"sensors": []}) == "items"
+    assert check({"sensors": [{"sensor": 1}]}) == "type"
+    assert check({"sensors": [{}]}) == "required"
+
+
+def test_fields():
+    check = compile_fields({"sensors.0.sensor": "string", "meta.count": ["integer", "null"]})
+    assert check({"sensors": [{"sensor": "x"}], "meta": {"count": None}}) is None
+    assert check({"sensors": [{"sensor": 1}], "meta": {"count": 1}}) == "type"
+    assert check({"sensors": [], "meta": {"count": 1}}) == "required"
+    assert check({"sensors": {"0": {"sensor": "x"}}, "meta": {"count": 1}}) == "required"
+    assert check({"sensors": [{"sensor": "x"}]}) == "required"
+    assert check({"sensors": [{"sensor": "x"}], "meta": "x"}) == "required"
+
+
+@pytest.mark.parametrize(
+    "properties",
+    [
+        {"payload_schema": {"type": "strin"}},
+        {"payload_schema": {"pattern": "("}},
+        {"payload_schema": {"properties": ["a"]}},
+        {"payload_schema": "not a schema"},
+        {"payload_schema": {"minimum": "5"}},
+        {"payload_schema": {"maximum": True}},
+        {"payload_schema": {"maxLength": "3"}},
+        {"payload_schema": {"minItems": -1}},
+        {"payload_schema": {"required": "ab"}},
+        {"payload_schema": {"enum": "ab"}},
+        {"payload_schema": {"additionalProperties": {"type": "string"}}},
+        {"payload_schema": {"items": [{"type": "string"}]}},
+        {"payload_schema": {"type": {"name": "string"}}},
+        {"payload_schema": {"anyOf": [{"type": "string"}]}},
+        {"payload_schema": {"properties": {"a": {"$ref": "#/definitions/a"}}}},
+        {"payload_schema": {"const": 1}},
+        {"payload_schema": {"exclusiveMinimum": 0}},
+        {"payload_schema": {"format": "date-time"}},
+        {"payload_fields": {"a.b": "strin"}},
+        {"payload_fields": ["a.b"]},
+    ],
+)
+def test_compile_errors(properties):
+    with pytest.raises(ValueError):
+        compile_payload_validator(properties)
+
+
+def test_annotations_are_ignored():
+    check = compile_payload_validator(
+        {"payload_schema": {"$schema": "http://json-schema.org/draft-07/schema#", "title": "T", "type": "object"}}
+    )
+    assert check({}) is None
+    assert check([]) == "type"
+
+
+def test_no_rules():
+    assert compile_payload_validator(None) is None
+    assert compile_payload_validator({}) is None
+    assert compile_payload_validator({"async_ack": True}) is None
+    assert compile_payload_validator("not a dict") is None
+
+
+def test_schema_and_fields_combined():
+    check = compile_payload_validator(
+        {"payload_schema": {"type": "object"}, "payload_fields": {"sensors.0.sensor": "string"}}
+    )
+    assert check({"sensors": [{"sensor": "x"}]}) is None
+    assert check([]) == "type"
+    assert check({}) == "required"
+
+
+def test_invalid_json():
+    check = compile_payload_validator({"payload_schema": {"type": "object"}})
+    assert check_payload(make_view(b"{not json"), check) == INVALID_JSON
+    assert check_payload(make_view(b""), check) == INVALID_JSON
+    assert check_payload(make_view(b"\xff\xfe\x00"), check) == INVALID_JSON
+    assert check_payload(make_view(b"{}"), check) is None
+
+
+def test_validate_payload_counts_rejections():
+    validation.rejections.clear()
+    endpoint = make_endpoint(None)
+    endpoint.payload_validator = compile_payload_validator({"payload_fields": {"a": "string"}})
+    assert validate_payload(make_view(b'{"a": "x"}'), endpoint) == (True, None)
+    assert validate_payload(make_view(b'{"a": 1}'), endpoint) == (False, "type")
+    assert validate_payload(make_view(b"x"), endpoint) == (False, INVALID_JSON)
+    assert validate_payload(make_view(b"x"), endpoint) == (False, INVALID_JSON)
+    assert validation.rejections == {"type": 1, INVALID_JSON: 2}
+    endpoint.payload_validator = None
+    assert validate_payload(make_view(b"x"), endpoint) == (True, None)
+
+
+def test_invalid_config_fails_closed():
+    endpoint = make_endpoint({"payload_schema": {"type": "strin"}})
+    endpoint.payload_validator = reject_invalid_config
+    view = make_view(b"{}", query={"x-api-key": "abc123"})
+    auth_ok, message, status_code = asyncio.run(CesvaRequestHandler().validate(view, endpoint))
+    assert auth_ok is False
+    assert status_code == 500
+    assert validate_payload(view, endpoint) == (False, INVALID_CONFIG)
+
+
+def test_cesva_parses_body_once(monkeypatch):
+    loads_calls = []
+    original_loads = json.loads
+
+    def counting_loads(*args, **kwargs):
+        loads_calls.append(args)
+        return original_loads(*args, **kwargs)
+
+    endpoint = make_endpoint({"payload_fields": {"sensors.0.sensor": "string"}})
+    endpoint.payload_validator = compile_payload_validator(endpoint.properties)
+    body = json.dumps({"sensors": [{"sensor": "TA120-T246187-N"}]}).encode()
+    view = make_view(body, query={"x-api-key": "abc123"})
+    monkeypatch.setattr("endpoints.models.json.loads", counting_loads)
+    result = asyncio.run(CesvaRequestHandler().process_request(view, endpoint))
+    assert result == (True, "TA120-T246187", "test.rawdata", "Request accepted", 202)
+    assert len(loads_calls) == 1
+
+
+def test_cesva_rejects_missing_sensor():
+    validation.rejections.clear()
+    endpoint = make_endpoint(None)
+    view = make_view(b'{"sensors": []}', query={"x-api-key": "abc123"})
+    auth_ok, device_id, topic_name, _, status_code = asyncio.run(CesvaRequestHandler().process_request(view, endpoint))
+    assert (auth_ok, device_id, topic_name, status_code) == (False, None, None, 400)
+    # Counted in /stats payload_rejections like other validation errors
+    assert validation.rejections == {"required": 1}